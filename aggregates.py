@@ -0,0 +1,373 @@
+"""Precomputed aggregates of the covid-19 and crime datasets"""
+
+import copy
+from typing import Optional, Union
+
+import numpy as np
+
+import data_cache
+from columnar import Table, load_covid_table, load_crimes_table, month_key, update_covid_table
+from crime_names import PROVINCES, TypeMatcher
+
+DIMENSIONS = ('province', 'service', 'month', 'violation')
+
+
+class CovidCube:
+    """The sum, count, minimum and maximum of every numeric column of the covid-19 dataset, for
+    every province and every month, all computed in one pass over the table.
+
+    Each aggregate is an array with one row per province and one column per month, from the
+    first month of the data to the last. Blank cells are left out of the counts, minimums and
+    maximums. The minimum and maximum of a cell without values are nan.
+
+    Instance Attributes:
+        - rows: the number of rows of the table the cube was built from
+        - offset: the offset of that table, which is how many bytes of its file the cube covers
+        - provinces: the provinces of the data, in the order of the rows of the arrays
+        - first_month: the month key of the first column of the arrays
+        - columns: the numeric columns of the data
+        - days: the number of rows of each province and month
+        - sums: a mapping from each column to the sums of its values
+        - counts: a mapping from each column to the number of its values that are not blank
+        - mins: a mapping from each column to the minimums of its values
+        - maxs: a mapping from each column to the maximums of its values
+    """
+    rows: int
+    offset: Optional[int]
+    provinces: list[str]
+    first_month: int
+    columns: list[str]
+    days: np.ndarray
+    sums: dict[str, np.ndarray]
+    counts: dict[str, np.ndarray]
+    mins: dict[str, np.ndarray]
+    maxs: dict[str, np.ndarray]
+
+    def __init__(self, table: Table) -> None:
+        self.rows = len(table)
+        self.offset = table.offset
+        self.provinces = list(table.vocabularies['prname'])
+        self.columns = [name for name in table.names if name in table.nulls]
+        keys = table.month_index().keys
+        self.first_month = int(keys.min()) if len(keys) > 0 else 0
+        months = int(keys.max()) - self.first_month + 1 if len(keys) > 0 else 0
+        shape = (len(self.provinces), months)
+
+        # sort the rows by cell once, then reduce every column over the same runs of rows
+        cells = table.columns['prname'].astype(np.int64) * months + (keys - self.first_month)
+        order = np.argsort(cells, kind='stable')
+        cells = cells[order]
+        starts = np.flatnonzero(np.r_[True, cells[1:] != cells[:-1]]) if len(cells) > 0 \
+            else np.array([], dtype=np.int64)
+        present = cells[starts]
+
+        self.days = self._spread(np.diff(np.r_[starts, len(cells)]), present, shape, 0)
+        self.sums = {}
+        self.counts = {}
+        self.mins = {}
+        self.maxs = {}
+        for name in self.columns:
+            values = table.columns[name][order]
+            nulls = table.nulls[name][order]
+            valid = values.astype(np.float64)
+            self.sums[name] = self._spread(np.add.reduceat(values, starts), present, shape, 0)
+            self.counts[name] = self._spread(np.add.reduceat(~nulls, starts, dtype=np.int64),
+                                             present, shape, 0)
+            self.mins[name] = self._spread(np.minimum.reduceat(np.where(nulls, np.inf, valid),
+                                                               starts), present, shape, np.nan)
+            self.maxs[name] = self._spread(np.maximum.reduceat(np.where(nulls, -np.inf, valid),
+                                                               starts), present, shape, np.nan)
+            self.mins[name][np.isinf(self.mins[name])] = np.nan
+            self.maxs[name][np.isinf(self.maxs[name])] = np.nan
+
+    def cell(self, province: str, month: list[int]) -> tuple[int, int]:
+        """Return the position of province and month ([year, month]) in the arrays, or (-1, -1)
+        if the data has no such province or month."""
+        column = month_key(month) - self.first_month
+        if province not in self.provinces or not 0 <= column < self.days.shape[1]:
+            return (-1, -1)
+        return (self.provinces.index(province), column)
+
+    def total(self, province: str, month: list[int], column: str) -> Union[int, float]:
+        """Return the sum of column for province in month, which is 0 if there are no rows."""
+        row, col = self.cell(province, month)
+        return self.sums[column][row, col].item() if row >= 0 else 0
+
+    def totals(self, months: list[list[int]], provinces: list[str],
+               columns: list[str]) -> np.ndarray:
+        """Return the sums of columns for every month ([year, month]) and province, as an array
+        indexed by month, province and column. The sums of a month or province the data does not
+        have are 0.
+
+        >>> cube = load_covid_cube('../../Data/covid19_original_data.csv')
+        >>> cube.totals([[2021, 4], [2021, 5]], ['Ontario', 'Quebec'], ['numtoday']).shape
+        (2, 2, 1)
+        """
+        rows = np.array([self.provinces.index(province) if province in self.provinces else -1
+                         for province in provinces], dtype=np.int64)
+        cols = np.array([month_key(month) - self.first_month for month in months],
+                        dtype=np.int64)
+        known = (rows[np.newaxis, :] >= 0) & (cols[:, np.newaxis] >= 0) \
+            & (cols[:, np.newaxis] < self.days.shape[1])
+        dtype = np.result_type(*[self.sums[name] for name in columns]) if columns else np.int64
+        totals = np.zeros((len(months), len(provinces), len(columns)), dtype=dtype)
+        if not known.any():
+            return totals
+
+        rows = rows.clip(0)[np.newaxis, :]
+        cols = cols.clip(0, self.days.shape[1] - 1)[:, np.newaxis]
+        for k, name in enumerate(columns):
+            totals[:, :, k] = np.where(known, self.sums[name][rows, cols], 0)
+        return totals
+
+    def means(self, province: str, column: str, months: list[list[int]]) -> list[Optional[float]]:
+        """Return the sum of column for province in each of months ([year, month]) divided by
+        the number of rows of that month, or None for a month without rows.
+
+        >>> cube = load_covid_cube('../../Data/covid19_original_data.csv')
+        >>> cube.means('Ontario', 'numactive', [[2021, 3], [2021, 4], [2021, 5]])
+        """
+        totals = self.totals(months, [province], [column])[:, 0, 0].tolist()
+        days = [self.day_count(province, month) for month in months]
+        return [total / count if count else None for total, count in zip(totals, days)]
+
+    def day_count(self, province: str, month: list[int]) -> int:
+        """Return the number of rows of province in month."""
+        row, col = self.cell(province, month)
+        return int(self.days[row, col]) if row >= 0 else 0
+
+    def merged(self, other: 'CovidCube') -> 'CovidCube':
+        """Return the cube of the rows of this cube and of other together. Provinces and months
+        that only one of them has are added."""
+        if other.days.size == 0:
+            return self
+        elif self.days.size == 0:
+            return other
+
+        provinces = self.provinces + [name for name in other.provinces
+                                      if name not in self.provinces]
+        first = min(self.first_month, other.first_month)
+        last = max(self.first_month + self.days.shape[1], other.first_month + other.days.shape[1])
+        shape = (len(provinces), last - first)
+        merged = copy.copy(self)
+        merged.rows = self.rows + other.rows
+        merged.provinces = provinces
+        merged.first_month = first
+
+        def combined(mine: np.ndarray, theirs: np.ndarray, empty: Union[int, float]) -> tuple:
+            """Return mine and theirs placed at their provinces and months in arrays of shape."""
+            placed = []
+            for cube, values in ((self, mine), (other, theirs)):
+                rows = [provinces.index(name) for name in cube.provinces]
+                start = cube.first_month - first
+                array = np.full(shape, empty, dtype=np.result_type(mine, theirs))
+                array[np.ix_(rows, range(start, start + values.shape[1]))] = values
+                placed.append(array)
+            return tuple(placed)
+
+        merged.days = sum(combined(self.days, other.days, 0))
+        merged.sums = {name: sum(combined(self.sums[name], other.sums[name], 0))
+                       for name in self.columns}
+        merged.counts = {name: sum(combined(self.counts[name], other.counts[name], 0))
+                         for name in self.columns}
+        merged.mins = {name: np.fmin(*combined(self.mins[name], other.mins[name], np.nan))
+                       for name in self.columns}
+        merged.maxs = {name: np.fmax(*combined(self.maxs[name], other.maxs[name], np.nan))
+                       for name in self.columns}
+        return merged
+
+    def _spread(self, values: np.ndarray, cells: np.ndarray, shape: tuple[int, int],
+                empty: Union[int, float]) -> np.ndarray:
+        """Return an array of the given shape holding values at the flat positions cells and
+        empty everywhere else."""
+        dtype = np.float64 if isinstance(empty, float) else values.dtype
+        spread = np.full(shape[0] * shape[1], empty, dtype=dtype)
+        spread[cells] = values
+        return spread.reshape(shape)
+
+
+def load_covid_cube(filename: str) -> CovidCube:
+    """Return the CovidCube of the covid-19 csv file filename.
+
+    Use data_cache.load(filename, load_covid_cube) to build the cube once per process and again
+    only when the file changes.
+
+    >>> cube = load_covid_cube('../../Data/covid19_original_data.csv')
+    >>> cube.total('Ontario', [2021, 5], 'numtoday')
+    """
+    return CovidCube(data_cache.load(filename, load_covid_table, update_covid_table))
+
+
+def update_covid_cube(filename: str, cube: CovidCube, offset: int) -> Optional[CovidCube]:
+    """Return cube, which holds the aggregates of the first offset bytes of the covid-19 csv file
+    filename, with the rows appended to filename since folded in. Return None if the table of
+    filename cannot be updated either.
+
+    The appended rows are the ones the shared table of filename gained past the rows of cube, so
+    they are only parsed once, by update_covid_table. Use
+    data_cache.load(filename, load_covid_cube, update_covid_cube) to keep a cube up to date.
+    """
+    table = data_cache.load(filename, load_covid_table, update_covid_table)
+    if len(table) < cube.rows:
+        return None
+    merged = copy.copy(cube.merged(CovidCube(table.take(np.arange(cube.rows, len(table))))))
+    merged.offset = table.offset
+    return merged
+
+
+class CrimeGroups:
+    """The sum and the number of non-blank values of the crime data for every police service,
+    month and violation, computed in one pass over the table.
+
+    Any coarser grouping, over any of the dimensions in DIMENSIONS, is then computed from these
+    groups without reading the rows again. The province of a police service is each name in
+    PROVINCES that its geography contains, as in crimes_by_province.
+
+    Instance Attributes:
+        - services: the distinct geographies (police services) of the data
+        - months: the distinct month keys of the data, sorted
+        - violations: the distinct violations of the data
+        - service_codes: the position in services of the service of every group
+        - month_codes: the position in months of the month of every group
+        - violation_codes: the position in violations of the violation of every group
+        - sums: the sum of the values of every group, blank values counting as 0
+        - counts: the number of values of every group that are not blank
+    """
+    services: list[str]
+    months: np.ndarray
+    violations: list[str]
+    service_codes: np.ndarray
+    month_codes: np.ndarray
+    violation_codes: np.ndarray
+    sums: np.ndarray
+    counts: np.ndarray
+
+    def __init__(self, table: Table) -> None:
+        self.services = list(table.vocabularies['geo'])
+        self.violations = list(table.vocabularies['violation'])
+        keys = table.month_index().keys
+        self.months = np.unique(keys)
+
+        cells = (table.columns['geo'].astype(np.int64) * len(self.months)
+                 + np.searchsorted(self.months, keys)) * len(self.violations) \
+            + table.columns['violation']
+        order = np.argsort(cells, kind='stable')
+        cells = cells[order]
+        starts = np.flatnonzero(np.r_[True, cells[1:] != cells[:-1]]) if len(cells) > 0 \
+            else np.array([], dtype=np.int64)
+        groups = cells[starts]
+
+        self.service_codes, rest = np.divmod(groups, len(self.months) * len(self.violations))
+        self.month_codes, self.violation_codes = np.divmod(rest, len(self.violations))
+        if len(starts) > 0:
+            self.sums = np.add.reduceat(table.columns['value'][order], starts)
+            self.counts = np.add.reduceat(~table.nulls['value'][order], starts, dtype=np.int64)
+        else:
+            self.sums = np.array([], dtype=np.int64)
+            self.counts = np.array([], dtype=np.int64)
+
+    def aggregate(self, by: list[str], provinces: Optional[list[str]] = None,
+                  start_date: Optional[list[int]] = None, end_date: Optional[list[int]] = None,
+                  types: Optional[list[str]] = None) -> list[list]:
+        """Return [the value of each dimension in by, sum, count, mean] for every distinct
+        combination of the dimensions in by, sorted by those dimensions. count is the number of
+        values that are not blank, and mean is None when there are none.
+
+        Only the rows whose geography contains one of provinces, whose month is between
+        start_date and end_date ([year, month], both included), and whose violation contains
+        one of types are counted, for the conditions that are given. When grouping by province,
+        the provinces are the names in provinces if it is given. Months are given as
+        [year, month].
+
+        >>> groups = load_crime_groups('../../Data/crimes_original_data.csv')
+        >>> groups.aggregate(['province', 'month'], ['Ontario', 'Quebec'], [2021, 3], [2021, 5])
+        """
+        keep = np.ones(len(self.sums), dtype=bool)
+        if provinces is not None:
+            wanted = np.array([any(other in service for other in provinces)
+                               for service in self.services], dtype=bool)
+            keep = keep & wanted[self.service_codes]
+        if start_date is not None:
+            keep = keep & (self.months[self.month_codes] >= month_key(start_date))
+        if end_date is not None:
+            keep = keep & (self.months[self.month_codes] <= month_key(end_date))
+        if types is not None:
+            matcher = TypeMatcher(types)
+            wanted = np.array([matcher.matches(violation) for violation in self.violations],
+                              dtype=bool)
+            keep = keep & wanted[self.violation_codes]
+        selected = np.flatnonzero(keep)
+
+        labels = list(provinces) if provinces is not None else PROVINCES
+        province_codes = None
+        if 'province' in by:
+            # a group is counted once for every province its police service belongs to
+            member = np.array([[label in service for label in labels]
+                               for service in self.services], dtype=bool)
+            member = member.reshape(len(self.services), len(labels))
+            rows, province_codes = np.nonzero(member[self.service_codes[selected]])
+            selected = selected[rows]
+
+        codes = {'province': province_codes, 'service': self.service_codes[selected],
+                 'month': self.month_codes[selected],
+                 'violation': self.violation_codes[selected]}
+        if by:
+            keys, inverse = np.unique(np.stack([codes[name] for name in by], axis=1), axis=0,
+                                      return_inverse=True)
+            inverse = inverse.reshape(-1)
+        else:
+            keys = np.zeros((1 if len(selected) > 0 else 0, 0), dtype=np.int64)
+            inverse = np.zeros(len(selected), dtype=np.int64)
+
+        sums = np.zeros(len(keys), dtype=self.sums.dtype)
+        counts = np.zeros(len(keys), dtype=np.int64)
+        np.add.at(sums, inverse, self.sums[selected])
+        np.add.at(counts, inverse, self.counts[selected])
+
+        names = {'province': labels, 'service': self.services,
+                 'month': [[(key - 1) // 12, (key - 1) % 12 + 1] for key in self.months.tolist()],
+                 'violation': self.violations}
+        list_so_far = []
+        for key, total, count in zip(keys.tolist(), sums.tolist(), counts.tolist()):
+            list_so_far.append([names[name][code] for name, code in zip(by, key)]
+                               + [total, count, total / count if count else None])
+
+        return list_so_far
+
+    def means(self, provinces: list[str], months: list[list[int]],
+              types: Optional[list[str]] = None) -> list[Optional[float]]:
+        """Return the mean of the non-blank values of the rows whose geography contains one of
+        provinces and whose violation contains one of types, if types is given, for each of
+        months ([year, month]), or None for a month without values. All the months are summed
+        together in one aggregate.
+
+        >>> groups = load_crime_groups('../../Data/crimes_original_data.csv')
+        >>> groups.means(['Ontario'], [[2021, 3], [2021, 4], [2021, 5]], ['Total assaults'])
+        """
+        if not months:
+            return []
+        rows = self.aggregate(['month'], provinces, min(months, key=month_key),
+                              max(months, key=month_key), types)
+        by_month = {tuple(row[0]): row[3] for row in rows}
+        return [by_month.get(tuple(month)) for month in months]
+
+    def total(self, provinces: list[str], month: list[int],
+              types: Optional[list[str]] = None) -> tuple[int, int]:
+        """Return the sum and the number of non-blank values of the rows whose geography contains
+        one of provinces, whose month is month ([year, month]), and whose violation contains one
+        of types, if types is given.
+
+        >>> groups = load_crime_groups('../../Data/crimes_original_data.csv')
+        >>> groups.total(['Ontario'], [2021, 5], ['Total assaults'])
+        """
+        rows = self.aggregate([], provinces, month, month, types)
+        return (rows[0][0], rows[0][1]) if rows else (0, 0)
+
+
+def load_crime_groups(filename: str) -> CrimeGroups:
+    """Return the CrimeGroups of the crime csv file filename.
+
+    Use data_cache.load(filename, load_crime_groups) to build the groups once per process and
+    again only when the file changes.
+    """
+    return CrimeGroups(data_cache.load(filename, load_crimes_table))
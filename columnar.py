@@ -0,0 +1,675 @@
+"""Columnar storage for the covid-19 and crime datasets"""
+
+import csv
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Iterable, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+import data_cache
+import snapshot
+
+
+class Column(NamedTuple):
+    """The description of one column of a csv file.
+
+    Instance Attributes:
+        - name: the name of the column
+        - dtype: the type the values of the column are converted into
+        - null: the value given to blank and 'N/A' cells when the column is converted into rows
+    """
+    name: str
+    dtype: type
+    null: Any
+
+
+def _numbers(dtype: type, names: str) -> list[Column]:
+    """Return a Column of the given dtype, with 0 as the null value, for each name in names."""
+    return [Column(name, dtype, dtype(0)) for name in names.split()]
+
+
+# The 40 columns of 'Data/covid19_original_data.csv', in order. The types are the same ones
+# dataset_by_type in covid_filtering has always used.
+COVID_SCHEMA = [Column('pruid', str, ''), Column('prname', str, ''), Column('prnameFR', str, ''),
+                Column('date', str, '')] \
+    + _numbers(int, 'update numconf numprob numdeaths numtotal numtested numtests numrecover') \
+    + _numbers(float, 'percentrecover') + _numbers(int, 'ratetested ratetests numtoday') \
+    + _numbers(float, 'percentoday ratetotal ratedeaths numdeathstoday percentdeath') \
+    + _numbers(int, 'numtestedtoday numteststoday numrecoveredtoday') \
+    + _numbers(float, 'percentactive') + _numbers(int, 'numactive') \
+    + _numbers(float, 'rateactive') + _numbers(int, 'numtotal_last14') \
+    + _numbers(float, 'ratetotal_last14') + _numbers(int, 'numdeaths_last14') \
+    + _numbers(float, 'ratedeaths_last14') + _numbers(int, 'numtotal_last7') \
+    + _numbers(float, 'ratetotal_last7') + _numbers(int, 'numdeaths_last7') \
+    + _numbers(float, 'ratedeaths_last7') + _numbers(int, 'avgtotal_last7') \
+    + _numbers(float, 'avgincidence_last7') + _numbers(int, 'avgdeaths_last7') \
+    + _numbers(float, 'avgratedeaths_last7 raterecovered')
+
+# The columns of 'Data/crimes_original_data.csv' kept by read_crimes in crime_filtering, which are
+# the columns 0, 1, 3 and 11 of the file. A blank value is None in rows.
+CRIME_SCHEMA = [Column('date', str, ''), Column('geo', str, ''), Column('violation', str, ''),
+                Column('value', int, None)]
+
+NULL_VALUES = ('', 'N/A')
+
+_DTYPES = {str: object, int: np.int64, float: np.float64}
+
+# Crime data files of at least this many bytes are parsed on several processes.
+PARALLEL_BYTES = 32 * 1024 * 1024
+
+# The version of the layout of the tables in snapshots. Snapshots of any other version are parsed
+# again.
+SNAPSHOT_FORMAT = 4
+
+
+def schema_of(names: list[str], schema: list[Column]) -> list[Column]:
+    """Return the columns of schema called names, in the order of names. A name that is not in
+    schema, such as a column added to the csv file later, is kept as a string column.
+
+    >>> [column.dtype for column in schema_of(['date', 'numtoday', 'new'], COVID_SCHEMA)]
+    [<class 'str'>, <class 'int'>, <class 'str'>]
+    """
+    by_name = {column.name: column for column in schema}
+    return [by_name.get(name, Column(name, str, '')) for name in names]
+
+
+class Table:
+    """A dataset stored column by column instead of row by row.
+
+    Every column is a numpy array of the same length. Numeric columns hold int64 or float64 values.
+    String columns are dictionary-encoded: they hold int32 codes into vocabularies[name], the list
+    of the distinct strings of the column, which is shared by every table taken from this one.
+    Blank and 'N/A' cells of numeric columns are stored as 0, like dataset_by_type does, and are
+    marked as True in nulls[name].
+
+    Instance Attributes:
+        - names: the names of the columns, in order
+        - columns: a mapping from each column name to its values, or to its codes
+        - nulls: a mapping from each numeric column name to a mask of its blank cells
+        - vocabularies: a mapping from each string column name to its distinct strings
+        - offset: the number of bytes at the start of the csv file the rows were parsed from, or
+          None if it is not known
+    """
+    names: list[str]
+    columns: dict[str, np.ndarray]
+    nulls: dict[str, np.ndarray]
+    vocabularies: dict[str, list[str]]
+    offset: Optional[int]
+
+    def __init__(self, names: list[str], columns: dict[str, np.ndarray],
+                 nulls: dict[str, np.ndarray],
+                 vocabularies: Optional[dict[str, list[str]]] = None,
+                 offset: Optional[int] = None) -> None:
+        self.names = list(names)
+        self.columns = columns
+        self.nulls = nulls
+        self.vocabularies = vocabularies or {}
+        self.offset = offset
+        self._month_index = None
+        self._indexes = {}
+
+    def __len__(self) -> int:
+        if not self.names:
+            return 0
+        return len(self.columns[self.names[0]])
+
+    def column(self, name: str) -> np.ndarray:
+        """Return the values of the column called name, decoding the strings of a string column."""
+        if name in self.vocabularies:
+            return np.array(self.vocabularies[name], dtype=object)[self.columns[name]]
+        return self.columns[name]
+
+    def where(self, name: str, predicate: Callable[[Any], bool]) -> np.ndarray:
+        """Return a mask of the rows whose value in the column called name satisfies predicate.
+
+        For a string column, predicate is called once per distinct string and the rows are then
+        selected by comparing their integer codes.
+        """
+        if name in self.vocabularies:
+            keep = np.array([predicate(value) for value in self.vocabularies[name]], dtype=bool)
+            return keep[self.columns[name]]
+        return np.array([predicate(value) for value in self.columns[name].tolist()], dtype=bool)
+
+    def month_index(self) -> 'MonthIndex':
+        """Return the MonthIndex of the date column of this table, building it the first time."""
+        if self._month_index is None:
+            self._month_index = MonthIndex(self)
+        return self._month_index
+
+    def index(self, name: str, labels: Optional[Callable[[str], Iterable[str]]] = None) \
+            -> dict[str, np.ndarray]:
+        """Return a mapping from each string of the string column called name to the sorted rows
+        holding it. The mapping is built the first time it is asked for.
+
+        If labels is given, the rows of each string s are instead listed under every label in
+        labels(s), which is called once per distinct string.
+        """
+        if (name, labels) not in self._indexes:
+            codes = self.columns[name]
+            vocabulary = self.vocabularies[name]
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(len(vocabulary) + 1))
+
+            parts = {}
+            for code, value in enumerate(vocabulary):
+                for label in (labels(value) if labels is not None else [value]):
+                    parts.setdefault(label, []).append(order[bounds[code]:bounds[code + 1]])
+            self._indexes[(name, labels)] = {
+                label: np.sort(np.concatenate(rows)) if len(rows) > 1 else rows[0]
+                for label, rows in parts.items()}
+
+        return self._indexes[(name, labels)]
+
+    def rows_of(self, name: str, values: Iterable[str],
+                labels: Optional[Callable[[str], Iterable[str]]] = None) -> np.ndarray:
+        """Return the sorted rows listed under any of values in index(name, labels), which is the
+        union of the rows of every value."""
+        index = self.index(name, labels)
+        parts = [index[value] for value in set(values) if value in index]
+        if not parts:
+            return np.array([], dtype=np.int64)
+        return parts[0] if len(parts) == 1 else np.unique(np.concatenate(parts))
+
+    def take(self, rows: np.ndarray) -> 'Table':
+        """Return a new table holding only the given rows. rows is either an array of row indices
+        or a boolean mask with one entry per row."""
+        return Table(self.names,
+                     {name: self.columns[name][rows] for name in self.names},
+                     {name: self.nulls[name][rows] for name in self.nulls},
+                     self.vocabularies)
+
+    def extend(self, other: 'Table') -> 'Table':
+        """Return a new table holding the rows of this table followed by the rows of other, which
+        has the same columns. The vocabularies of this table are extended with the strings that
+        only other has, so the codes of the rows of this table do not change. The rows of other
+        are expected to continue the file of this table, so the new table has the offset of
+        other."""
+        return concatenate_tables([self, other])
+
+    def select(self, names: list[str]) -> 'Table':
+        """Return a new table holding only the given columns, in the given order."""
+        return Table(names,
+                     {name: self.columns[name] for name in names},
+                     {name: self.nulls[name] for name in names if name in self.nulls},
+                     {name: self.vocabularies[name] for name in names
+                      if name in self.vocabularies})
+
+    def to_rows(self) -> list[list]:
+        """Return the table as a list of rows, the same shape dataset_by_type returns."""
+        return [list(row) for row in zip(*(self._values(name) for name in self.names))]
+
+    def _values(self, name: str) -> list:
+        """Return the values of the column called name as a list of python objects."""
+        values = self.columns[name].tolist()
+        if name in self.vocabularies:
+            vocabulary = self.vocabularies[name]
+            return [vocabulary[code] for code in values]
+        return values
+
+
+def concatenate_tables(tables: list[Table]) -> Table:
+    """Return a new table holding the rows of tables, which all have the same columns, one table
+    after the other. The vocabulary of a string column is the vocabulary of the first table
+    followed by the strings each later table adds, so the codes of the first table do not change.
+    The new table has the offset of the last table, whose rows end the file.
+    """
+    first = tables[0]
+    columns = {}
+    vocabularies = {}
+
+    for name in first.names:
+        if name in first.vocabularies:
+            columns[name], vocabularies[name] = _concatenate_codes(
+                [table.columns[name] for table in tables],
+                [table.vocabularies[name] for table in tables])
+        else:
+            columns[name] = np.concatenate([table.columns[name] for table in tables])
+
+    return Table(first.names, columns,
+                 {name: np.concatenate([table.nulls[name] for table in tables])
+                  for name in first.nulls},
+                 vocabularies, tables[-1].offset)
+
+
+def _concatenate_codes(codes: list[np.ndarray], vocabularies: list[list[str]]) \
+        -> tuple[np.ndarray, list[str]]:
+    """Return codes one after the other, each recoded from its own list in vocabularies to the
+    vocabulary they all refer to: the first list followed by the strings each later list adds."""
+    vocabulary = list(vocabularies[0])
+    positions = {value: code for code, value in enumerate(vocabulary)}
+    recoded = [codes[0]]
+    for other_codes, other_vocabulary in zip(codes[1:], vocabularies[1:]):
+        for value in other_vocabulary:
+            if value not in positions:
+                positions[value] = len(vocabulary)
+                vocabulary.append(value)
+        mapping = np.array([positions[value] for value in other_vocabulary], dtype=np.int32)
+        recoded.append(mapping[other_codes])
+    return np.concatenate(recoded).astype(np.int32), vocabulary
+
+
+class MonthIndex:
+    """The rows of a Table sorted by the month key of their date, so the rows of any range of
+    months are found by binary search.
+
+    Instance Attributes:
+        - keys: the month key of every row of the table, in the order of the table
+        - order: the rows of the table sorted by month key, or None if they already are
+        - sorted_keys: keys in sorted order
+    """
+    keys: np.ndarray
+    order: Optional[np.ndarray]
+    sorted_keys: np.ndarray
+
+    def __init__(self, table: Table) -> None:
+        if 'date' in table.vocabularies:
+            # parse each distinct date once and give every row the key of its date code
+            distinct = np.array([month_key_of(date) for date in table.vocabularies['date']],
+                                dtype=np.int64)
+            self.keys = distinct[table.columns['date']]
+        else:
+            self.keys = np.array([month_key_of(date) for date in table.columns['date']],
+                                 dtype=np.int64)
+
+        if np.all(self.keys[1:] >= self.keys[:-1]):
+            self.order = None
+            self.sorted_keys = self.keys
+        else:
+            self.order = np.argsort(self.keys, kind='stable')
+            self.sorted_keys = self.keys[self.order]
+
+    def rows(self, start_date: list[int], end_date: list[int]) -> np.ndarray:
+        """Return the rows whose month is between start_date and end_date ([year, month]),
+        inclusive, in the order of the table."""
+        start, stop = (np.searchsorted(self.sorted_keys, month_key(start_date), side='left'),
+                       np.searchsorted(self.sorted_keys, month_key(end_date), side='right'))
+        if self.order is None:
+            return np.arange(start, stop)
+        return np.sort(self.order[start:stop])
+
+
+def convert_column(values: Sequence[str], column: Column) -> tuple[np.ndarray, np.ndarray]:
+    """Return the values converted into an array of the dtype of column, in one step for the whole
+    column, and a mask of the cells that were blank or 'N/A'. Blank cells of numeric columns are
+    stored as 0. values is not modified.
+
+    An int column with a value that is not an int, such as '12.5', is converted to floats instead.
+
+    >>> data, mask = convert_column(['3', '', '4'], Column('numtoday', int, 0))
+    >>> data.tolist(), mask.tolist()
+    ([3, 0, 4], [False, True, False])
+    """
+    raw = np.array(values, dtype=object)
+    if column.dtype is str:
+        return raw, np.zeros(len(raw), dtype=bool)
+
+    mask = (raw == NULL_VALUES[0]) | (raw == NULL_VALUES[1])
+    if mask.any():
+        raw[mask] = '0'
+    try:
+        return np.fromiter(map(column.dtype, raw), _DTYPES[column.dtype], len(raw)), mask
+    except ValueError:
+        if column.dtype is not int:
+            raise
+        return np.fromiter(map(float, raw), np.float64, len(raw)), mask
+
+
+def encode_column(values: Sequence[str]) -> tuple[np.ndarray, list[str]]:
+    """Return the int32 codes of values and the list of their distinct strings, in the order they
+    first appear, such that values[i] == vocabulary[codes[i]].
+
+    >>> codes, vocabulary = encode_column(['Ontario', 'Quebec', 'Ontario'])
+    >>> codes.tolist(), vocabulary
+    ([0, 1, 0], ['Ontario', 'Quebec'])
+    """
+    lookup = {}
+    codes = np.fromiter((lookup.setdefault(value, len(lookup)) for value in values), np.int32,
+                        len(values))
+    return codes, list(lookup)
+
+
+def convert_rows(rows: list[list[str]], schema: list[Column]) -> list[list]:
+    """Return new rows with the values of rows converted to the types in schema, converting a whole
+    column at a time. Blank and 'N/A' cells are replaced by the null value of their column. rows
+    is not modified.
+
+    >>> convert_rows([['2021-05', '', '4']], schema_of(['date', 'numtoday', 'rateactive'], \
+    COVID_SCHEMA))
+    [['2021-05', 0, 4.0]]
+    """
+    columns = []
+    for column, values in zip(schema, zip(*rows)):
+        try:
+            columns.append(list(map(column.dtype, values)))
+        except ValueError:  # the column has blank cells, or floats in an int column
+            columns.append([convert_value(value, column) for value in values])
+
+    return [list(row) for row in zip(*columns)]
+
+
+def convert_row(row: list[str], schema: list[Column]) -> list:
+    """Return the row converted to the types in schema. Blank and 'N/A' cells are replaced by the
+    null value of their column.
+
+    >>> convert_row(['2021-05', '', '4'], schema_of(['date', 'numtoday', 'rateactive'], \
+    COVID_SCHEMA))
+    ['2021-05', 0, 4.0]
+    """
+    return [convert_value(value, column) for column, value in zip(schema, row)]
+
+
+def convert_value(value: str, column: Column) -> Any:
+    """Return value converted to the type of column, or the null value of column if value is blank
+    or 'N/A'. A value of an int column that is not an int, such as '12.5', becomes a float.
+
+    >>> convert_value('12.5', Column('value', int, None))
+    12.5
+    """
+    if column.dtype is not str and value in NULL_VALUES:
+        return column.null
+    try:
+        return column.dtype(value)
+    except ValueError:
+        if column.dtype is not int:
+            raise
+        return float(value)
+
+
+def month_key(date: list[int]) -> int:
+    """Return the month key year * 12 + month of date, which is in the format [year, month].
+    Consecutive months have consecutive keys, across any number of years.
+
+    >>> month_key([2021, 1]) - month_key([2020, 12])
+    1
+    """
+    return date[0] * 12 + date[1]
+
+
+def month_range(start_date: list[int], end_date: list[int]) -> list[list[int]]:
+    """Return every month from start_date to end_date, both included, in the format
+    [year, month]. The range can span any number of years.
+
+    >>> month_range([2020, 11], [2021, 2])
+    [[2020, 11], [2020, 12], [2021, 1], [2021, 2]]
+    """
+    return [[(key - 1) // 12, (key - 1) % 12 + 1]
+            for key in range(month_key(start_date), month_key(end_date) + 1)]
+
+
+@lru_cache(maxsize=None)
+def month_key_of(date: str) -> int:
+    """Return the month key of the 'YYYY-MM-DD' or 'YYYY-MM' date. Each distinct date is only
+    parsed once.
+
+    >>> month_key_of('2021-05-03') == month_key([2021, 5])
+    True
+    """
+    date_in_list = str.split(date, '-')
+    return month_key([int(date_in_list[0]), int(date_in_list[1])])
+
+
+def in_date_range(date: str, start_date: list[int], end_date: list[int]) -> bool:
+    """Return whether the 'YYYY-MM-DD' or 'YYYY-MM' date falls between start_date and end_date,
+    which are in the format [year, month], inclusive.
+
+    >>> in_date_range('2021-05-03', [2020, 4], [2021, 5])
+    True
+    >>> in_date_range('2021-05-03', [2020, 4], [2022, 1])
+    True
+    """
+    return month_key(start_date) <= month_key_of(date) <= month_key(end_date)
+
+
+def load_covid_table(filename: str) -> Table:
+    """Return the covid-19 data in filename as a Table.
+
+    The table is read from the snapshot of filename when the snapshot is up to date. Otherwise
+    the file is parsed once, every column is converted in a single step, and the snapshot is
+    written again for the next load.
+
+    The columns are the ones named in the header of filename. The 40 columns load_data in
+    covid_filtering describes have their usual types, and any column added later is kept as
+    strings.
+
+    The file is assumed to only ever grow at its end, as new dates are added. When it has grown
+    since the snapshot was written, only the new rows are parsed and added to the snapshot.
+
+    >>> table = load_covid_table('../../Data/covid19_original_data.csv')
+    """
+    return _load_table(filename, _parse_covid, parse_covid_tail)
+
+
+def update_covid_table(filename: str, table: Table, offset: int) -> Optional[Table]:
+    """Return table, which holds the rows of the first offset bytes of the covid-19 csv file
+    filename, followed by the rows appended to filename since. Only the appended rows are parsed.
+
+    Return None if the rows after offset cannot be added to table, in which case filename has to
+    be loaded again. Whether filename still starts with those offset bytes is not checked here:
+    data_cache.load(filename, load_covid_table, update_covid_table), which keeps a loaded table up
+    to date, checks it with prefix_checksum first.
+    """
+    tail = parse_covid_tail(filename, offset)
+    if tail is None or tail.names != table.names:
+        return None
+    return table.extend(tail)
+
+
+def parse_covid_tail(filename: str, offset: int) -> Optional[Table]:
+    """Parse the rows of the covid-19 data in filename after its first offset bytes into a Table.
+
+    The columns of the table are the ones named in the header of filename, and its offset is where
+    the bytes it read from filename end.
+
+    Return None if offset does not fall at the end of a row of filename, or is past its end.
+    """
+    with open(filename, 'rb') as f:
+        if offset <= 0 or offset > os.fstat(f.fileno()).st_size:
+            return None
+        header = next(csv.reader([f.readline().decode('UTF8')]))
+        f.seek(offset - 1)
+        if f.read(1) != b'\n':
+            return None
+        data = f.read()
+
+    rows = csv.reader(io.StringIO(data.decode('UTF8'), newline=''), delimiter=',')
+    return _covid_table(schema_of(header, COVID_SCHEMA), rows, offset + len(data))
+
+
+def load_crimes_table(filename: str) -> Table:
+    """Return the columns of the crime data in filename kept by read_crimes as a Table.
+
+    Like load_covid_table, the table is read from the snapshot of filename when it is up to date.
+
+    >>> table = load_crimes_table('../../Data/crimes_original_data.csv')
+    """
+    return _load_table(filename, _parse_crimes)
+
+
+def read_crime_rows(filename: str, workers: Optional[int] = None) -> list[list[str]]:
+    """Return the date, geography, violation and value columns (the columns 0, 1, 3 and 11) of the
+    crime data in filename, as the strings of the file.
+
+    The rows after the header are split into workers chunks of about the same size, each ending at
+    a newline, and every chunk is parsed by its own process. The rows are returned in the order of
+    the file. With 1 worker the file is parsed in this process. workers defaults to the number
+    of CPU cores for a file of at least PARALLEL_BYTES bytes, and to 1 for a smaller one.
+
+    >>> rows = read_crime_rows('../../Data/crimes_original_data.csv', 4)
+    """
+    rows = []
+    for chunk in _map_crime_chunks(_read_crime_chunk, filename, workers):
+        rows.extend(chunk)
+
+    return rows
+
+
+def _map_crime_chunks(parse: Callable[[str, tuple[int, int]], Any], filename: str,
+                      workers: Optional[int] = None) -> list:
+    """Return parse(filename, bounds) for the bounds of every chunk of the rows of filename, in the
+    order of the file, calling parse on workers processes if there is more than one chunk."""
+    bounds = _crime_chunk_bounds(filename, workers or _workers_for(filename))
+    if len(bounds) <= 1:
+        return [parse(filename, each) for each in bounds]
+
+    with ProcessPoolExecutor(max_workers=len(bounds)) as executor:
+        return list(executor.map(parse, [filename] * len(bounds), bounds))
+
+
+def _workers_for(filename: str) -> int:
+    """Return the number of processes worth parsing filename on."""
+    if os.path.getsize(filename) < PARALLEL_BYTES:
+        return 1
+    return os.cpu_count() or 1
+
+
+def _crime_chunk_bounds(filename: str, chunks: int) -> list[tuple[int, int]]:
+    """Return the (start, stop) byte ranges that split the rows of filename, after the header,
+    into at most chunks parts. Every range starts at the beginning of a line."""
+    size = os.path.getsize(filename)
+    bounds = []
+
+    with open(filename, 'rb') as f:
+        start = len(f.readline())  # skip the header
+        step = max((size - start) // chunks, 1)
+
+        while start < size:
+            f.seek(min(start + step, size))
+            f.readline()  # move to the end of the line the chunk would end in
+            stop = min(f.tell(), size)
+            bounds.append((start, stop))
+            start = stop
+
+    return bounds
+
+
+def _read_crime_chunk(filename: str, bounds: tuple[int, int]) -> list[list[str]]:
+    """Return the date, geography, violation and value of the rows of filename in the byte range
+    bounds."""
+    with open(filename, 'rb') as f:
+        f.seek(bounds[0])
+        text = f.read(bounds[1] - bounds[0]).decode('UTF8')
+
+    return [[row[0], row[1], row[3], row[11]]
+            for row in csv.reader(io.StringIO(text, newline=''), delimiter=',')]
+
+
+def _load_table(filename: str, parse: Callable[[str], Table],
+                parse_tail: Optional[Callable[[str, int], Optional[Table]]] = None) -> Table:
+    """Return the table in the snapshot of filename if it is up to date, or parse filename and
+    write its snapshot otherwise.
+
+    If parse_tail is given and filename was only appended to since its snapshot was written, with
+    the same columns, the rows of the snapshot are kept and parse_tail parses the rest of the file.
+    The snapshot keeps the offset of its table, or the size of the file if the parser does not
+    tell it, and the prefix_checksum of that many bytes, to tell an append from a rewrite.
+    """
+    source = data_cache.fingerprint(filename)
+    path = snapshot.snapshot_path(filename)
+    stored = _read_table(path, source)
+    if stored is not None:
+        return stored
+
+    table = None
+    if parse_tail is not None:
+        stored = snapshot.read_snapshot(path, None)
+        if stored is not None and stored.metadata.get('format') == SNAPSHOT_FORMAT \
+                and data_cache.prefix_checksum(filename, stored.metadata['offset']) \
+                == stored.metadata['checksum']:
+            tail = parse_tail(filename, stored.metadata['offset'])
+            table = _table_of(stored)
+            table = table.extend(tail) if tail is not None and tail.names == table.names else None
+    if table is None:
+        table = parse(filename)
+    try:
+        _write_table(filename, source, table)
+    except OSError:
+        pass  # the snapshot only saves time, so a read-only data directory is not an error
+    return table
+
+
+def _read_table(path: str, source: Optional[tuple[int, int]]) -> Optional[Table]:
+    """Return the table in the snapshot at path, or None if there is none of the current format
+    made from the version source of its csv file."""
+    stored = snapshot.read_snapshot(path, source)
+    if stored is None or stored.metadata.get('format') != SNAPSHOT_FORMAT:
+        return None
+    return _table_of(stored)
+
+
+def _table_of(stored: snapshot.Snapshot) -> Table:
+    """Return the Table stored in a snapshot written by _write_table."""
+    return Table(stored.names, stored.columns, stored.nulls, stored.vocabularies,
+                 stored.metadata['offset'])
+
+
+def _write_table(filename: str, source: tuple[int, int], table: Table) -> None:
+    """Write table, which was parsed from the version source of filename, to the snapshot of
+    filename. The metadata holds the offset of the table, or the size in source if it has none,
+    and the prefix_checksum of that many bytes of filename."""
+    offset = table.offset if table.offset is not None else source[0]
+    checksum = data_cache.prefix_checksum(filename, offset)
+    snapshot.write_snapshot(snapshot.snapshot_path(filename), source, table.names, table.columns,
+                            table.nulls,
+                            {'format': SNAPSHOT_FORMAT, 'offset': offset, 'checksum': checksum},
+                            table.vocabularies)
+
+
+def _parse_covid(filename: str) -> Table:
+    """Parse the covid-19 data in filename into a Table of the columns named in its header. The
+    offset of the table is the number of bytes read, which rows appended while the file was read
+    are part of if they were parsed."""
+    with open(filename, 'rb') as f:
+        data = f.read()
+
+    reader = csv.reader(io.StringIO(data.decode('UTF8'), newline=''), delimiter=',')
+    schema = schema_of(next(reader), COVID_SCHEMA)
+    return _covid_table(schema, reader, len(data))
+
+
+def _covid_table(schema: list[Column], rows: Iterable[list[str]], offset: int) -> Table:
+    """Return a Table of the covid-19 rows of strings, which were parsed from the first offset
+    bytes of their file."""
+    checked = []
+    for row in rows:
+        assert len(row) == len(schema)  # 'Expected every row to have a cell for every column.'
+        checked.append(row)
+
+    table = _build_table(schema, checked)
+    table.offset = offset
+    return table
+
+
+def _parse_crimes(filename: str) -> Table:
+    """Parse the crime data in filename into a Table, on several processes if the file has at
+    least PARALLEL_BYTES bytes. Every process builds the Table of its own chunk, so only numpy
+    arrays and the vocabularies of the chunk are sent back, and the chunks are concatenated
+    here."""
+    tables = _map_crime_chunks(_parse_crime_chunk, filename)
+    if not tables:
+        return _build_table(CRIME_SCHEMA, [])
+    return tables[0] if len(tables) == 1 else concatenate_tables(tables)
+
+
+def _parse_crime_chunk(filename: str, bounds: tuple[int, int]) -> Table:
+    """Return the Table of the rows of filename in the byte range bounds."""
+    return _build_table(CRIME_SCHEMA, _read_crime_chunk(filename, bounds))
+
+
+def _build_table(schema: list[Column], rows: list) -> Table:
+    """Return a Table of the rows of strings, converting each column to its type in schema."""
+    fields = list(zip(*rows)) if rows else [() for _ in schema]
+    names = [column.name for column in schema]
+    columns = {}
+    nulls = {}
+    vocabularies = {}
+
+    for column, values in zip(schema, fields):
+        if column.dtype is str:
+            columns[column.name], vocabularies[column.name] = encode_column(values)
+        else:
+            columns[column.name], nulls[column.name] = convert_column(values, column)
+
+    return Table(names, columns, nulls, vocabularies)
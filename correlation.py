@@ -0,0 +1,335 @@
+"""Correlation of many covid-19 and crime series at once
+
+A series is the monthly values of one covid-19 category or one crime type in one province. The
+series of several provinces and categories are stacked into arrays of shape
+(provinces, categories, months), so every pair of a covid-19 series and a crime series of the same
+province is correlated by one matrix product.
+
+>>> x = covid_series(['Ontario', 'Quebec'], ['numactive', 'numtoday'], [2020, 4], [2021, 5])
+>>> y = crime_series(['Ontario', 'Quebec'], ['Total assaults'], [2020, 4], [2021, 5])
+>>> correlation_matrix(x, y).shape
+(2, 2, 1)
+"""
+
+import math
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+import covid_filtering
+import crime_filtering
+from columnar import month_key, month_range
+from crime_names import TypeMatcher
+
+
+def correlation_matrix(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Return the Pearson correlation coefficient of every series of x with every series of y.
+
+    x has the shape (..., C, T) and y the shape (..., V, T): C and V series of the same T months,
+    under any leading dimensions, such as provinces, that broadcast together. The result has the
+    shape (..., C, V). The coefficient of a pair is nan when either series is constant or has a
+    nan value.
+
+    >>> correlation_matrix([[1, 2, 3], [5, 5, 5]], [[2, 4, 7], [3, 2, 1]]).round(3).tolist()
+    [[0.993, -1.0], [nan, nan]]
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    x = x - x.mean(axis=-1, keepdims=True)
+    y = y - y.mean(axis=-1, keepdims=True)
+
+    covariance = x @ np.swapaxes(y, -1, -2)
+    scale = np.sqrt((x * x).sum(axis=-1))[..., :, np.newaxis] \
+        * np.sqrt((y * y).sum(axis=-1))[..., np.newaxis, :]
+    varies = (np.ptp(x, axis=-1) > 0)[..., :, np.newaxis] \
+        & (np.ptp(y, axis=-1) > 0)[..., np.newaxis, :]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r_values = np.where(varies, covariance / scale, np.nan)
+    return np.clip(r_values, -1.0, 1.0)
+
+
+def covid_series(provinces: list[str], categories: list[str], start_month: list[int],
+                 end_month: list[int]) -> np.ndarray:
+    """Return the monthly averages of each of categories in each of provinces, from start_month to
+    end_month, as an array of shape (provinces, categories, months). The values are the ones
+    covid_data_for_r in main rounds, and a month without data is nan.
+    """
+    cube = covid_filtering.cube()
+    months = month_range(start_month, end_month)
+    series = np.full((len(provinces), len(categories), len(months)), np.nan)
+
+    for i, province in enumerate(provinces):
+        for j, category in enumerate(categories):
+            series[i, j] = [np.nan if mean is None else mean
+                            for mean in cube.means(province, category, months)]
+
+    return series
+
+
+def crime_series(provinces: list[str], types: list[str], start_month: list[int],
+                 end_month: list[int]) -> np.ndarray:
+    """Return the monthly averages of each of types in each of provinces, from start_month to
+    end_month, as an array of shape (provinces, types, months). The values are the ones
+    crime_data_for_r in main rounds, and a month without values is nan.
+
+    All the provinces, violations and months are grouped in one aggregate, and every violation is
+    then added to each of the types it contains.
+    """
+    groups = crime_filtering.groups()
+    matcher = TypeMatcher(types)
+    first = month_key(start_month)
+    shape = (len(provinces), len(types), month_key(end_month) - first + 1)
+    sums = np.zeros(shape)
+    counts = np.zeros(shape, dtype=np.int64)
+
+    for province, violation, month, total, count, _ in groups.aggregate(
+            ['province', 'violation', 'month'], provinces, start_month, end_month, types):
+        for type_ in matcher.classify(violation):
+            position = (provinces.index(province), types.index(type_), month_key(month) - first)
+            sums[position] = sums[position] + total
+            counts[position] = counts[position] + count
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def rolling_correlation(x: np.ndarray, y: np.ndarray, window: int) -> np.ndarray:
+    """Return the Pearson correlation coefficient of x and y over every window of window
+    consecutive months, moved one month at a time.
+
+    x and y have the shapes (..., T), such as the lists covid_data_for_r and crime_data_for_r
+    return or the arrays of covid_series and crime_series, and are paired along any leading
+    dimensions that broadcast together. The result has the shape (..., T - window + 1), and its
+    entry i is the coefficient over the months i to i + window - 1. It is nan for a window in
+    which either series is constant or has a missing month.
+
+    The sums of x, y, xy, x² and y² over every window are differences of running sums, so each
+    step of the window costs the same however long the window is.
+
+    Raise ValueError if window is smaller than 1.
+
+    >>> rolling_correlation([1, 2, 3, 4, 5], [2, 4, 5, 4, 5], 3).round(3).tolist()
+    [0.982, 0.0, 0.0]
+    """
+    if window < 1:
+        raise ValueError('window must be at least 1 month, not %d' % window)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    x, y = np.broadcast_arrays(x, y)
+    missing = np.isnan(x) | np.isnan(y)
+    # centring first keeps the running sums small, so their differences stay accurate
+    x = np.where(missing, 0.0, x - np.nanmean(x, axis=-1, keepdims=True))
+    y = np.where(missing, 0.0, y - np.nanmean(y, axis=-1, keepdims=True))
+
+    def window_sums(values: np.ndarray) -> np.ndarray:
+        """Return the sum of values over every window along the last axis."""
+        running = np.cumsum(values, axis=-1)
+        running = np.concatenate([np.zeros(running.shape[:-1] + (1,)), running], axis=-1)
+        return running[..., window:] - running[..., :-window]
+
+    sum_x = window_sums(x)
+    sum_y = window_sums(y)
+    sum_xx = window_sums(x * x)
+    sum_yy = window_sums(y * y)
+    variance_x = window * sum_xx - sum_x * sum_x
+    variance_y = window * sum_yy - sum_y * sum_y
+    covariance = window * window_sums(x * y) - sum_x * sum_y
+
+    varies = (variance_x > 1e-10 * window * sum_xx) & (variance_y > 1e-10 * window * sum_yy)
+    complete = window_sums(missing.astype(np.float64)) == 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r_values = np.where(varies & complete,
+                            covariance / np.sqrt(variance_x * variance_y), np.nan)
+    return np.clip(r_values, -1.0, 1.0)
+
+
+def permutation_test(x: np.ndarray, y: np.ndarray, resamples: int = 10000,
+                     seed: Optional[int] = None, workers: Optional[int] = None,
+                     batch: int = 1000) -> np.ndarray:
+    """Return the two-sided permutation p-value of the correlation of every series of x with
+    every series of y, which have the shapes of the arguments of correlation_matrix.
+
+    The months of y are shuffled resamples times, and the p-value of a pair is the share of the
+    shuffles, counting the observed order once, whose coefficient is at least as far from 0 as
+    the observed one. It is nan where the observed coefficient is nan.
+
+    The shuffles are drawn batch at a time as one matrix of month orders, each batch from its own
+    child of the SeedSequence of seed, so the result only depends on seed and batch. If workers
+    is given, the batches are spread over that many processes.
+
+    >>> x = covid_series(['Ontario'], ['numactive'], [2020, 4], [2021, 5])
+    >>> y = crime_series(['Ontario'], ['Total assaults', 'Robbery'], [2020, 4], [2021, 5])
+    >>> permutation_test(x, y, seed=0)
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    observed = correlation_matrix(x, y)
+    counts = sum(_in_batches(_permutation_counts, (x, y, observed), resamples, seed, workers,
+                             batch))
+
+    return np.where(np.isnan(observed), np.nan, (counts + 1) / (resamples + 1))
+
+
+def bootstrap_interval(x: np.ndarray, y: np.ndarray, resamples: int = 10000,
+                       confidence: float = 0.95, seed: Optional[int] = None,
+                       workers: Optional[int] = None,
+                       batch: int = 1000) -> tuple[np.ndarray, np.ndarray]:
+    """Return the lower and upper bounds of the percentile bootstrap confidence interval of the
+    correlation of every series of x with every series of y, which have the shapes of the
+    arguments of correlation_matrix.
+
+    The months of each pair are drawn with replacement resamples times, the same months for x and
+    y. Resamples in which a series is constant are left out, and the bounds are nan if all are,
+    or if the observed coefficient is nan.
+    The resamples are drawn and spread over workers like in permutation_test. All the resampled
+    coefficients are kept until the bounds are taken, as float32.
+
+    >>> x = covid_series(['Ontario'], ['numactive'], [2020, 4], [2021, 5])
+    >>> y = crime_series(['Ontario'], ['Total assaults', 'Robbery'], [2020, 4], [2021, 5])
+    >>> low, high = bootstrap_interval(x, y, seed=0)
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    r_values = np.concatenate(_in_batches(_bootstrap_values, (x, y), resamples, seed, workers,
+                                          batch), axis=-3)
+    tail = (1 - confidence) / 2 * 100
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # pairs without any usable resample
+        low, high = np.nanpercentile(r_values, [tail, 100 - tail], axis=-3)
+    undefined = np.isnan(correlation_matrix(x, y))
+    return np.where(undefined, np.nan, low), np.where(undefined, np.nan, high)
+
+
+def _in_batches(function: Callable[..., Any], arguments: tuple, resamples: int,
+                seed: Optional[int], workers: Optional[int], batch: int) -> list:
+    """Return function(*arguments, seed_sequence, size) for every batch of the resamples, in the
+    order of the batches, running the batches on workers processes if workers is given."""
+    seeds = np.random.SeedSequence(seed).spawn(math.ceil(resamples / batch))
+    sizes = [min(batch, resamples - i * batch) for i in range(len(seeds))]
+    if workers is None:
+        return [function(*arguments, each, size) for each, size in zip(seeds, sizes)]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(function, *([argument] * len(seeds) for argument in arguments),
+                                 seeds, sizes))
+
+
+def _permutation_counts(x: np.ndarray, y: np.ndarray, observed: np.ndarray,
+                        seed: np.random.SeedSequence, size: int) -> np.ndarray:
+    """Return the number of size shuffles of the months of y, drawn from seed, whose coefficient
+    with x is at least as far from 0 as observed."""
+    months = x.shape[-1]
+    orders = np.random.default_rng(seed).permuted(np.tile(np.arange(months), (size, 1)), axis=1)
+    shuffled = np.moveaxis(y[..., orders], -2, -3)
+    r_values = correlation_matrix(x[..., np.newaxis, :, :], shuffled)
+
+    with np.errstate(invalid='ignore'):
+        return (np.abs(r_values) >= np.abs(observed[..., np.newaxis, :, :]) - 1e-12).sum(axis=-3)
+
+
+def _bootstrap_values(x: np.ndarray, y: np.ndarray, seed: np.random.SeedSequence,
+                      size: int) -> np.ndarray:
+    """Return the coefficients of size resamples of the months of x and y, drawn from seed, with
+    the resamples along the third axis from the end."""
+    months = x.shape[-1]
+    picks = np.random.default_rng(seed).integers(0, months, size=(size, months))
+    return correlation_matrix(np.moveaxis(x[..., picks], -2, -3),
+                              np.moveaxis(y[..., picks], -2, -3)).astype(np.float32)
+
+
+# The length of series from which lagged_correlation uses the FFT instead of direct sums.
+FFT_LENGTH = 64
+
+
+def lagged_correlation(x: np.ndarray, y: np.ndarray, max_lag: int,
+                       min_lag: Optional[int] = None,
+                       method: str = 'auto') -> tuple[np.ndarray, np.ndarray]:
+    """Return the lags from min_lag to max_lag and the Pearson correlation coefficient of x and y
+    at each of them, where at lag k each value of x is paired with the value of y k steps later.
+    A positive lag therefore means y follows x. min_lag defaults to -max_lag.
+
+    x and y have the shapes (..., T), such as the lists covid_data_for_r and crime_data_for_r
+    return or daily series, and are paired along any leading dimensions that broadcast together.
+    The coefficients have the shape (..., number of lags). Each lag only uses the pairs where
+    both values exist, and its coefficient is nan if fewer than 3 pairs are left or either side
+    is constant.
+
+    The sums behind every lag are cross-correlations, computed with the FFT for all the lags at
+    once when method is 'fft', or lag by lag when it is 'direct'. 'auto' uses the FFT for series
+    of at least FFT_LENGTH values, such as daily ones, and direct sums for short monthly ones.
+
+    >>> lags, r_values = lagged_correlation([1, 3, 2, 5, 4, 6, 5], [0, 1, 3, 2, 5, 4, 6], 2)
+    >>> lags.tolist(), r_values.round(3).tolist()
+    ([-2, -1, 0, 1, 2], [0.48, 0.908, 0.643, 1.0, 0.3])
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    x, y = np.broadcast_arrays(x, y)
+    months = x.shape[-1]
+    min_lag = -max_lag if min_lag is None else min_lag
+    lags = np.arange(max(min_lag, 1 - months), min(max_lag, months - 1) + 1)
+
+    present_x = (~np.isnan(x)).astype(np.float64)
+    present_y = (~np.isnan(y)).astype(np.float64)
+    # centring first keeps the sums small, so the differences below stay accurate
+    x = np.where(present_x > 0, x - np.nanmean(x, axis=-1, keepdims=True), 0.0)
+    y = np.where(present_y > 0, y - np.nanmean(y, axis=-1, keepdims=True), 0.0)
+
+    if method == 'auto':
+        method = 'fft' if months >= FFT_LENGTH else 'direct'
+    cross = _fft_cross_sums if method == 'fft' else _direct_cross_sums
+    pairs = np.round(cross(present_x, present_y, lags))
+    sum_x = cross(x, present_y, lags)
+    sum_y = cross(present_x, y, lags)
+    sum_xx = cross(x * x, present_y, lags)
+    sum_yy = cross(present_x, y * y, lags)
+    sum_xy = cross(x, y, lags)
+
+    variance_x = pairs * sum_xx - sum_x * sum_x
+    variance_y = pairs * sum_yy - sum_y * sum_y
+    covariance = pairs * sum_xy - sum_x * sum_y
+    defined = (pairs >= 3) & (variance_x > 1e-10 * pairs * sum_xx) \
+        & (variance_y > 1e-10 * pairs * sum_yy)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r_values = np.where(defined, covariance / np.sqrt(variance_x * variance_y), np.nan)
+    return lags, np.clip(r_values, -1.0, 1.0)
+
+
+def peak_lag(lags: np.ndarray, r_values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Return the lag of lagged_correlation at which each pair of series is the most strongly
+    correlated, in either direction, and the coefficient at that lag. Both are nan for a pair
+    whose coefficients are all nan.
+
+    >>> lags, r_values = lagged_correlation([1, 3, 2, 5, 4, 6, 5], [0, 1, 3, 2, 5, 4, 6], 2)
+    >>> peak_lag(lags, r_values)
+    (array(1.), array(1.))
+    """
+    strength = np.where(np.isnan(r_values), -1.0, np.abs(r_values))
+    best = np.argmax(strength, axis=-1)
+    peak = np.take_along_axis(r_values, best[..., np.newaxis], axis=-1)[..., 0]
+    undefined = np.isnan(peak)
+
+    return np.where(undefined, np.nan, lags[best]), peak
+
+
+def _direct_cross_sums(a: np.ndarray, b: np.ndarray, lags: np.ndarray) -> np.ndarray:
+    """Return the sum of a[t] * b[t + k] over every t for which both exist, for every lag k of
+    lags, with the lags along the last axis, one lag at a time."""
+    length = a.shape[-1]
+    sums = [(a[..., :length - k] * b[..., k:]).sum(axis=-1) if k >= 0
+            else (a[..., -k:] * b[..., :length + k]).sum(axis=-1) for k in lags.tolist()]
+    return np.stack(sums, axis=-1) if sums else np.zeros(a.shape[:-1] + (0,))
+
+
+def _fft_cross_sums(a: np.ndarray, b: np.ndarray, lags: np.ndarray) -> np.ndarray:
+    """Return the same sums as _direct_cross_sums, for all the lags at once with the FFT."""
+    length = a.shape[-1]
+    size = 1 << max(2 * length - 2, 1).bit_length()
+    sums = np.fft.irfft(np.conj(np.fft.rfft(a, size)) * np.fft.rfft(b, size), size)
+    return sums[..., lags % size]
@@ -2,6 +2,15 @@
 
 import csv
 import math
+from typing import Iterator, Optional, Union
+
+import data_cache
+from aggregates import CovidCube, load_covid_cube, update_covid_cube
+from columnar import COVID_SCHEMA, Table, convert_row, convert_rows, in_date_range, \
+    load_covid_table, schema_of, update_covid_table
+from query import CovidQuery
+
+COVID_FILE = '../../Data/covid19_original_data.csv'
 
 
 def load_data(filename: str) -> list[list[str]]:
@@ -16,104 +25,135 @@ def load_data(filename: str) -> list[list[str]]:
     numtotal_last7, ratetotal_last7, numdeaths_last7, ratedeaths_last7, avgtotal_last7,
     avgincidence_last7, avgdeaths_last7, avgratedeaths_last7, raterecovered, in that order.
 
+    Every cell is returned as the text it has in filename, in a single pass over the file. The
+    typed columns are returned by load_covid_table instead, which reads them from a snapshot.
+
     >>> load_data('../../Data/covid19_original_data.csv')
     """
-    sublist_so_far = []
-    list_so_far = []
-
-    with open(filename) as f:
+    with open(filename, encoding='UTF8', newline='') as f:
         reader = csv.reader(f, delimiter=',')
         next(reader)  # skip the header
+        return list(reader)
 
-        for row in reader:
-            assert len(row) == 40  # 'Expected every row to contain 40 elements.'
-            # row is a list of strings
-            sublist_so_far = sublist_so_far + \
-                             [str(row[0]), str(row[1]), str(row[2]), str(row[3]), str(row[4]),
-                              str(row[5]), str(row[6]), str(row[7]), str(row[8]), str(row[9]),
-                              str(row[10]), str(row[11]), str(row[12]), str(row[13]),
-                              str(row[14]), str(row[15]), str(row[16]), str(row[17]),
-                              str(row[18]), str(row[19]), str(row[20]), str(row[21]),
-                              str(row[22]), str(row[23]), str(row[24]), str(row[25]),
-                              str(row[26]), str(row[27]), str(row[28]), str(row[29]),
-                              str(row[30]), str(row[31]), str(row[32]), str(row[33]),
-                              str(row[34]), str(row[35]), str(row[36]), str(row[37]),
-                              str(row[38]), str(row[39])]
-            list_so_far = list_so_far + [sublist_so_far]
-            sublist_so_far = []
 
-    return list_so_far
+def iter_data(filename: str, start_date: Optional[list[int]] = None,
+              end_date: Optional[list[int]] = None,
+              provinces: Optional[list[str]] = None) -> Iterator[list[str, int, float]]:
+    """Yield the rows of the covid-19 data in filename one at a time, already converted to the
+    types dataset_by_type returns. Only one row is kept in memory at a time.
+
+    The columns of the rows are the ones named in the header of filename, so a column added to
+    the file later is kept as strings.
+
+    If start_date and end_date ([year, month]) or provinces are given, only the rows of those
+    months and provinces are yielded. The date and prname of every line are compared as raw bytes
+    before the line is parsed, so the rows that are skipped cost almost nothing.
 
+    The rows can be given as dataset to filter_by_date, filter_by_province, filter_columns and
+    total_by_month, which go through them one at a time, so a chain of them sums a month of one
+    province without the file ever being held in memory.
+
+    >>> rows = iter_data('../../Data/covid19_original_data.csv', [2021, 5], [2021, 5], ['Ontario'])
+    >>> total_by_month([2021, 5], 'Ontario', ['numtoday'], rows)
+    """
+    if start_date is None and end_date is None and provinces is None:
+        with open(filename, encoding='UTF8', newline='') as f:
+            reader = csv.reader(f, delimiter=',')
+            schema = schema_of(next(reader), COVID_SCHEMA)
+
+            for row in reader:
+                assert len(row) == len(schema)  # 'Expected every row to have every column.'
+                yield convert_row(row, schema)
+        return
+
+    first = b'%04d-%02d' % (start_date[0], start_date[1]) if start_date is not None else b''
+    last = b'%04d-%02d' % (end_date[0], end_date[1]) if end_date is not None else b'9999-99'
+    names = {province.encode() for province in provinces} if provinces is not None else None
+
+    with open(filename, 'rb') as f:
+        header = next(csv.reader([f.readline().decode('UTF8')]))
+        schema = schema_of(header, COVID_SCHEMA)
+        date, prname = header.index('date'), header.index('prname')
+
+        for line in f:
+            if b'"' in line:
+                # quoted fields may hold commas, so the line has to be parsed to be checked
+                fields = [field.encode() for field in next(csv.reader([line.decode('UTF8')]))]
+            else:
+                fields = line.split(b',', max(date, prname) + 1)
+            if not first <= fields[date][:7] <= last:
+                continue
+            if names is not None and fields[prname] not in names:
+                continue
 
-def dataset_by_type(dataset: list[list[str]]) -> list[list[str, int, float]]:
-    """Fill in the blank of list with 0 when the corresponding index is ''. Also, change all the
-    strings in the dataset into a appropriate type.
+            row = next(csv.reader([line.decode('UTF8')]))
+            assert len(row) == len(schema)  # 'Expected every row to have every column.'
+            yield convert_row(row, schema)
+
+
+def dataset_by_type(dataset: Union[list[list[str]], Table, Iterator[list]],
+                    categories: Optional[list[str]] = None) \
+        -> Union[list[list[str, int, float]], Table, Iterator[list]]:
+    """Return a new dataset with all the strings of dataset changed into the appropriate type of
+    their column. Blank and 'N/A' cells become 0 in numeric columns. dataset is not modified.
+
+    categories are the names of the columns of dataset, in order. They default to the 40 columns
+    of the csv file, so they only have to be given when filter_columns was used first. Columns
+    that are not one of the 40 are kept as strings.
+
+    A Table and the rows yielded by iter_data are already typed, so they are returned unchanged.
 
-    * Warning: This function should be runned before filter_columns(_, _) function.
     >>> dataset = filter_by_date([2020, 4], [2021, 5])
     >>> dataset_by_type(dataset)
+    >>> dataset_by_type(filter_columns(['date', 'numtoday'], dataset), ['date', 'numtoday'])
     """
-    sublist_so_far = []
-    new_list_so_far = []
+    if not isinstance(dataset, list):
+        return dataset
 
-    for i in range(len(dataset)):
-        for j in range(40):
-            if dataset[i][j] == '' or dataset[i][j] == 'N/A':
-                list.insert(dataset[i], j, '0')
-                list.pop(dataset[i], j + 1)
-        sublist_so_far = sublist_so_far + \
-                         [str(dataset[i][0]), str(dataset[i][1]), str(dataset[i][2]),
-                          str(dataset[i][3]), int(dataset[i][4]), int(dataset[i][5]),
-                          int(dataset[i][6]), int(dataset[i][7]), int(dataset[i][8]),
-                          int(dataset[i][9]), int(dataset[i][10]), int(dataset[i][11]),
-                          float(dataset[i][12]), int(dataset[i][13]), int(dataset[i][14]),
-                          int(dataset[i][15]), float(dataset[i][16]), float(dataset[i][17]),
-                          float(dataset[i][18]), float(dataset[i][19]), float(dataset[i][20]),
-                          int(dataset[i][21]), int(dataset[i][22]), int(dataset[i][23]),
-                          float(dataset[i][24]), int(dataset[i][25]), float(dataset[i][26]),
-                          int(dataset[i][27]), float(dataset[i][28]), int(dataset[i][29]),
-                          float(dataset[i][30]), int(dataset[i][31]), float(dataset[i][32]),
-                          int(dataset[i][33]), float(dataset[i][34]), int(dataset[i][35]),
-                          float(dataset[i][36]), int(dataset[i][37]), float(dataset[i][38]),
-                          float(dataset[i][39])]
-        new_list_so_far = new_list_so_far + [sublist_so_far]
-        sublist_so_far = []
+    if categories is None:
+        width = max((len(row) for row in dataset), default=0)
+        categories = [column.name for column in COVID_SCHEMA] \
+            + ['column' + str(i) for i in range(len(COVID_SCHEMA), width)]
 
-    return new_list_so_far
+    return convert_rows(dataset, schema_of(categories, COVID_SCHEMA))
 
 
-def filter_by_date(start_date: list[int], end_date: list[int]) -> list[list[str]]:
+def filter_by_date(start_date: list[int], end_date: list[int],
+                   dataset: Union[None, Table, Iterator[list]] = None) \
+        -> Union[list[list[str]], Table, Iterator[list]]:
     """Filter the covid-19 dataset by choosing starting year, month and ending year, month.
-    each start_date and end_date should be in format [year, month]. The earliest possible date for
-    start date 2020, 1 and latest possible date for end date is 2021, 11.
+    each start_date and end_date should be in format [year, month]. The range can span any number
+    of years; both ends are included.
 
-    This function is for the 'Data/covid19_original_data.csv' file.
+    This function is for the 'Data/covid19_original_data.csv' file. The file is parsed once per
+    process through data_cache. If a Table or a generator of rows of that file is given as dataset,
+    it is filtered instead, and a generator is returned for a generator. The rows of a Table are
+    found by binary search on the month keys of its MonthIndex.
 
     Preconditions:
     - start_date[0] <= end_date[0]
 
     >>> filter_by_date([2020, 4], [2021, 5])
     """
-    dataset = load_data('../../Data/covid19_original_data.csv')
+    if isinstance(dataset, Table):
+        return dataset.take(dataset.month_index().rows(start_date, end_date))
+    elif dataset is not None:
+        return (row for row in dataset if in_date_range(row[3], start_date, end_date))
+
+    dataset = data_cache.load(COVID_FILE, load_data)
     new_list_so_far = []
 
     for i in range(len(dataset)):
-        date_in_list = str.split(dataset[i][3], '-')
-        date_in_list = [int(x) for x in date_in_list]
-        if date_in_list[0] == start_date[0] == end_date[0]:
-            if start_date[1] <= date_in_list[1] <= end_date[1]:
-                new_list_so_far = new_list_so_far + [dataset[i]]
-        elif date_in_list[0] == start_date[0] and date_in_list[0] != end_date[0]:
-            if start_date[1] <= date_in_list[1]:
-                new_list_so_far = new_list_so_far + [dataset[i]]
-        elif date_in_list[0] != start_date[0] and date_in_list[0] == end_date[0]:
-            if date_in_list[1] <= end_date[1]:
-                new_list_so_far = new_list_so_far + [dataset[i]]
+        if in_date_range(dataset[i][3], start_date, end_date):
+            # copy the row, since the cached rows are shared with every other caller
+            new_list_so_far.append(list(dataset[i]))
 
     return new_list_so_far
 
 
-def filter_by_province(provinces: list[str], dataset: list[list[str]]) -> list[list[str]]:
+def filter_by_province(provinces: list[str],
+                       dataset: Union[list[list[str]], Table, Iterator[list]]) \
+        -> Union[list[list[str]], Table, Iterator[list]]:
     """Filter the covid-19 cases by selecting numbers of province that we want to focus on instead
     of using all the province from the original dataset.
 
@@ -121,34 +161,33 @@ def filter_by_province(provinces: list[str], dataset: list[list[str]]) -> list[l
     Newfoundland and Labrador, New Brunswick, Nova Scotia, Prince Edward Island, Yukon,
     Northwest Territories, Nunavut, Repatriated travellers, Canada.
 
-    This function must be used before filter_columns.
+    This function must be used before filter_columns. A generator is returned for a generator.
+    The rows of a Table are taken from its index of prname. Each row is kept at most once.
 
     >>> provinces = ['British Columbia', 'Alberta', 'Ontario', 'Quebec']
     >>> dataset = filter_by_date([2020, 7], [2020, 9])
     >>> filter_by_province(provinces, dataset)
     """
-    sublist_so_far = []
-    list_so_far = []
+    if isinstance(dataset, Table):
+        return dataset.take(dataset.rows_of('prname', provinces))
 
-    for k in range(len(dataset)):
-        for i in range(len(provinces)):
-            if dataset[k][1] == provinces[i]:
-                sublist_so_far = sublist_so_far + dataset[k]
-                list_so_far = list_so_far + [sublist_so_far]
-                sublist_so_far = []
-            else:
-                list_so_far = list_so_far
+    wanted = set(provinces)
+    if not isinstance(dataset, list):
+        return (row for row in dataset if row[1] in wanted)
 
-    return list_so_far
+    return [list(row) for row in dataset if row[1] in wanted]
 
 
-def filter_columns(categories: list[str], dataset: list[list[str, int, float]]) -> list[list[str, int, float]]:
+def filter_columns(categories: list[str],
+                   dataset: Union[list[list[str, int, float]], Table, Iterator[list]]) \
+        -> Union[list[list[str, int, float]], Table, Iterator[list]]:
     """Return the new dataset where it removes unnecessary columns from the original dataset.
     The new list includes the data for pruid, prname, date, numconf, numprob, numdeaths, numtotal,
     numtested, numtests, numrecover, numtoday, numdeathstoday, numtestedtoday, numteststoday,
     numrecoveredtoday, numactive, in that order.
     This function is designed for the file 'Data/covid19_original_data.csv'
     This function should be runned at the end of all the filtering process.
+    A generator is returned for a generator.
 
     >>> categories = ['prname', 'date', 'numconf', 'numprob', 'numdeaths', 'numtotal', \
     'numtested', 'numtests', 'numrecover', 'numtoday', 'numdeathstoday', 'numtestedtoday', \
@@ -165,6 +204,13 @@ def filter_columns(categories: list[str], dataset: list[list[str, int, float]])
                       'numdeaths_last14', 'ratedeaths_last14', 'numtotal_last7', 'ratetotal_last7',
                       'numdeaths_last7', 'ratedeaths_last7', 'avgtotal_last7', 'avgincidence_last7',
                       'avgdeaths_last7', 'avgratedeaths_last7', 'raterecovered']
+    if isinstance(dataset, Table):
+        return dataset.select([name for name in categories if name in all_categories])
+
+    indices = [all_categories.index(name) for name in categories if name in all_categories]
+    if not isinstance(dataset, list):
+        return ([row[index] for index in indices] for row in dataset)
+
     sublist_so_far = []
     list_so_far = []
 
@@ -179,28 +225,78 @@ def filter_columns(categories: list[str], dataset: list[list[str, int, float]])
     return list_so_far
 
 
-def total_by_month(month: list[int], province: str, categories: list[str]) \
-        -> list[str, int]:
+def query(dataset: Optional[Table] = None) -> CovidQuery:
+    """Return a lazy query over dataset, or over the covid-19 csv file loaded once per process as a
+    Table. The conditions of the query run together in one pass when a result is asked for.
+
+    >>> query().months([2021, 5], [2021, 5]).provinces(['Ontario']).columns(['numtoday']).sum()
+    """
+    if dataset is None:
+        dataset = data_cache.load(COVID_FILE, load_covid_table, update_covid_table)
+    return CovidQuery(dataset)
+
+
+def cube() -> CovidCube:
+    """Return the sums, counts, minimums and maximums of every numeric column of the covid-19 csv
+    file for every province and month. The cube is built once per process, and when rows are
+    appended to the file only those rows are added to it.
+
+    >>> cube().total('Ontario', [2021, 5], 'numtoday')
+    """
+    return data_cache.load(COVID_FILE, load_covid_cube, update_covid_cube)
+
+
+def total_by_month(month: list[int], province: str, categories: list[str],
+                   dataset: Union[None, Table, Iterator[list]] = None) -> list[str, int]:
     """Return the sum of 'numtoday', 'numactive' or other 'num_' categories of the
-    coressponding month. (Only applicable for data type int).
+    coressponding month. The sum of a float category, such as 'percentoday', is the float sum of
+    its values, which are not truncated to ints first, so it only depends on dataset through the
+    order the values are added in.
 
     The month should be given in following format [year, month].
     Only one province name should be entered.
+    Without dataset, the sums are read from the cube of the csv file. The sums over a Table are
+    computed by a query. If a generator from iter_data is given as dataset, it is consumed one row
+    at a time instead.
 
     >>> total_by_month([2021, 5], 'Ontario', ['numtoday', 'numactive'])
     """
+    if dataset is None:
+        totals = cube()
+        return [province, month] + [totals.total(province, month, name)
+                                    for name in categories if name in totals.columns]
+    elif isinstance(dataset, Table):
+        selected = query(dataset).months(month, month).provinces([province]).columns(categories)
+        return [province, month] + selected.sum()
+
     categories = ['prname', 'date'] + categories
-    dataset = filter_by_date(month, month)
+    dataset = filter_by_date(month, month, dataset)
     dataset = filter_by_province([province], dataset)
     dataset = dataset_by_type(dataset)
     dataset = filter_columns(categories, dataset)
-    sum_so_far = 0
-    list_so_far = [province, month]
+    sums_so_far = []
 
-    for j in range(2, len(dataset[1])):
-        for i in range(len(dataset)):
-            sum_so_far = sum_so_far + int(dataset[i][j])
-        list_so_far = list_so_far + [sum_so_far]
-        sum_so_far = 0
+    for row in dataset:
+        if not sums_so_far:
+            sums_so_far = [0] * (len(row) - 2)
+        sums_so_far = [total + value for total, value in zip(sums_so_far, row[2:])]
 
-    return list_so_far
+    return [province, month] + sums_so_far
+
+
+def total_by_months(months: list[list[int]], provinces: list[str], categories: list[str]) \
+        -> list[list]:
+    """Return total_by_month for every month of months and every province of provinces, in the
+    order of months and then provinces, all read from the cube of the csv file at once.
+
+    Each row is [province, month, total of each category], so the result can be passed to
+    pd.DataFrame as it is.
+
+    >>> total_by_months([[2021, 4], [2021, 5]], ['Ontario', 'Quebec'], ['numtoday', 'numactive'])
+    """
+    totals = cube()
+    categories = [name for name in categories if name in totals.columns]
+    sums = totals.totals(months, provinces, categories).tolist()
+
+    return [[province, month] + sums[i][j] for i, month in enumerate(months)
+            for j, province in enumerate(provinces)]
@@ -1,70 +1,141 @@
 """crime filtering"""
 import csv
+import os
+from typing import Iterator, Optional, Union
+
+import numpy as np
+
+import data_cache
+from aggregates import CrimeGroups, load_crime_groups
+from columnar import CRIME_SCHEMA, Table, convert_row, convert_value, in_date_range, \
+    read_crime_rows
+from crime_index import load_index
+from crime_names import PROVINCES, TypeMatcher, provinces_in
+
+CRIMES_FILE = '../../Data/crimes_original_data.csv'
 
 
 def read_crimes(filename: str) -> list[list[str]]:
-    """
+    """Return the date, geography, violation and value columns (the columns 0, 1, 3 and 11) of the
+    crime data in filename.
+
+    Every cell is returned as the text it has in filename. A large file is parsed on every CPU
+    core. Use load_crimes_table for the typed columns, which are kept in a snapshot between runs.
+
     >>> read_crimes('../../Data/crimes_original_data.csv')
     """
-    list_so_far = []
+    return read_crime_rows(filename)
+
+
+def read_crimes_parallel(filename: str, workers: Optional[int] = None) -> list[list[str]]:
+    """Return the same rows as read_crimes, parsing the file on several processes.
+
+    The file is split into workers chunks of about the same size, each ending at a newline, and
+    every chunk is parsed by its own process. The rows are returned in the order of the file.
+    workers defaults to the number of CPU cores, whatever the size of the file.
+
+    >>> read_crimes_parallel('../../Data/crimes_original_data.csv', 4)
+    """
+    return read_crime_rows(filename, workers or os.cpu_count() or 1)
+
+
+def iter_crimes(filename: str, start_date: Optional[list[int]] = None,
+                end_date: Optional[list[int]] = None, provinces: Optional[list[str]] = None,
+                types: Optional[list[str]] = None) -> Iterator[list[Union[str, Optional[int]]]]:
+    """Yield the same columns as read_crimes one row at a time, with the value converted to an int,
+    or None when it is blank. Without conditions, the file is scanned keeping one row in memory
+    at a time, and the rows can be passed on to crimes_by_province, crimes_by_type and
+    filter_by_month, which also yield their rows lazily.
+
+    If start_date and end_date ([year, month]), provinces or types are given, only the rows of
+    those months, of a geography containing one of provinces and of a violation containing one
+    of types are yielded, in the order of the file. They are found in the byte-range index of
+    crime_index, so only those rows are read from the file.
+
+    >>> rows = iter_crimes('../../Data/crimes_original_data.csv', [2020, 5], [2020, 5], ['Ontario'])
+    >>> total_value(rows)
+    """
+    if start_date is not None or end_date is not None or provinces is not None \
+            or types is not None:
+        index = data_cache.load(filename, load_index)
+        for row in index.rows(provinces, start_date, end_date, types):
+            yield convert_row(row, CRIME_SCHEMA)
+        return
 
     with open(filename, encoding='UTF8') as f:
         reader = csv.reader(f, delimiter=',')
-        next(reader)
+        next(reader)  # skip the header
 
         for row in reader:
-            sublist_so_far = []
-            sublist_so_far = sublist_so_far + [str(row[0]), str(row[1]), str(row[3]), str(row[11])]
-            list_so_far = list_so_far + [sublist_so_far]
-
-    return list_so_far
+            yield convert_row([row[0], row[1], row[3], row[11]], CRIME_SCHEMA)
 
 
-def crimes_by_province(dataset: list[list[str]], province: list[str]) -> list[list[str]]:
+def crimes_by_province(dataset: Union[list[list[str]], Table, Iterator[list]],
+                       province: list[str]) -> Union[list[list[str]], Table, Iterator[list]]:
     """
-    The name for provincial police should be one of
+    The name for provincial police should be one of PROVINCES, which are the provinces and
+    territories as they are written in the geographies, and 'Canada'. Any other name, such as that
+    of a city, keeps the rows whose geography contains it.
+
+    A row is kept once if its geography contains any of province. A generator is returned for a
+    generator. For a Table from load_crimes_table, the rows of the names in PROVINCES come from
+    its index of geographies by province, which is built once per table.
 
     >>> dataset = read_crimes('../../Data/crimes_original_data.csv')
     >>> crimes_by_province(dataset, ['Quebec', 'Ontario'])
     """
+    if isinstance(dataset, Table):
+        rows = dataset.rows_of('geo', province, provinces_in)
+        others = [other for other in province if other not in PROVINCES]
+        if others:
+            rows = np.union1d(rows, np.flatnonzero(dataset.where(
+                'geo', lambda geo: any(other in geo for other in others))))
+        return dataset.take(rows)
 
-    list_so_far = []
-    for each in dataset:
-        sublist_so_far = []
-        for other in province:
-            if other in each[1]:
-                sublist_so_far = sublist_so_far + each
-                list_so_far = list_so_far + [sublist_so_far]
-            else:
-                list_so_far = list_so_far
+    matches = {}
+    if not isinstance(dataset, list):
+        return (each for each in dataset if _in_provinces(each[1], province, matches))
+
+    return [list(each) for each in dataset if _in_provinces(each[1], province, matches)]
 
-    return list_so_far
 
+def _in_provinces(geo: str, province: list[str], matches: dict[str, bool]) -> bool:
+    """Return whether geo contains one of province, remembering the answer for each geo in
+    matches."""
+    if geo not in matches:
+        matches[geo] = any(other in geo for other in province)
+    return matches[geo]
 
-def crimes_by_type(dataset: list[list[str]], types: list[str]) -> list[list[str]]:
+
+def crimes_by_type(dataset: Union[list[list[str]], Table, Iterator[list]], types: list[str]) \
+        -> Union[list[list[str]], Table, Iterator[list]]:
     """
     * Caution: This function should be used before filter_by_month.
+    A row is kept once if its violation contains any of types. The types are compiled into a
+    TypeMatcher, so each distinct violation is searched once for all of them together.
+    A generator is returned for a generator. For a Table from load_crimes_table, the rows are
+    selected by their violation codes.
+
     >>> dataset = read_crimes('../../Data/crimes_original_data.csv')
     >>> crimes_by_type(dataset, ['Total assaults'])
     """
+    matcher = TypeMatcher(types)
+    if isinstance(dataset, Table):
+        return dataset.take(dataset.where('violation', matcher.matches))
+    elif not isinstance(dataset, list):
+        return (each for each in dataset if matcher.matches(each[2]))
 
-    list_so_far = []
-    for each in dataset:
-        sublist_so_far = []
-        for other in types:
-            if other in each[2]:
-                sublist_so_far = sublist_so_far + each
-                list_so_far = list_so_far + [sublist_so_far]
-            else:
-                list_so_far = list_so_far
-
-    return list_so_far
+    return [list(each) for each in dataset if matcher.matches(each[2])]
 
 
-def filter_by_month(dataset: list[list[str]], start_date: list[int], end_date: list[int]) -> list[list[str]]:
+def filter_by_month(dataset: Union[list[list[str]], Table, Iterator[list]], start_date: list[int],
+                    end_date: list[int]) -> Union[list[list[str]], Table, Iterator[list]]:
     """
     This function is for the 'Data/covid19_original_data.csv' file.
     * Caution: This function should be used after all the filtering.
+    A generator is returned for a generator, and a Table for a Table. The range can span any
+    number of years; both ends are included. The rows of a Table are found by binary search on
+    the month keys of its MonthIndex.
 
     Preconditions:
     - start_date[0] <= end_date[0]
@@ -72,38 +143,54 @@ def filter_by_month(dataset: list[list[str]], start_date: list[int], end_date: l
     >>> dataset = read_crimes('../../Data/crimes_original_data.csv')
     >>> filter_by_month(dataset, [2020, 4], [2021, 5])
     """
+    if isinstance(dataset, Table):
+        return dataset.take(dataset.month_index().rows(start_date, end_date))
+    elif not isinstance(dataset, list):
+        return (each for each in dataset if in_date_range(each[0], start_date, end_date))
+
     new_list_so_far = []
 
     for i in range(len(dataset)):
-        date_in_list = str.split(dataset[i][0], '-')
-        date_in_list = [int(x) for x in date_in_list]
-        if date_in_list[0] == start_date[0] == end_date[0]:
-            if start_date[1] <= date_in_list[1] <= end_date[1]:
-                new_list_so_far = new_list_so_far + [dataset[i]]
-        elif date_in_list[0] == start_date[0] and date_in_list[0] != end_date[0]:
-            if start_date[1] <= date_in_list[1]:
-                new_list_so_far = new_list_so_far + [dataset[i]]
-        elif date_in_list[0] != start_date[0] and date_in_list[0] == end_date[0]:
-            if date_in_list[1] <= end_date[1]:
-                new_list_so_far = new_list_so_far + [dataset[i]]
+        if in_date_range(dataset[i][0], start_date, end_date):
+            new_list_so_far.append(dataset[i])
 
     return new_list_so_far
 
 
-def sum_all_crimes(month: list[int], province: str) -> int:
-    """
-    ...
-    >>> sum_all_crimes([2020, 5], 'Ontario')
+def total_value(dataset: Union[list[list[str]], Table, Iterator[list]]) -> int:
+    """Return the sum of the values of the rows in dataset, skipping the blank values. The rows can
+    come from read_crimes, load_crimes_table or iter_crimes. The sum is a float if any value is.
+
+    >>> total_value([['2020-05', 'Toronto, Ontario', 'Robbery', '3'], \
+    ['2020-05', 'Toronto, Ontario', 'Total assaults', '']])
+    3
     """
-    dataset = read_crimes('../../Data/crimes_original_data.csv')
-    dataset = crimes_by_province(dataset, [province])
-    dataset = filter_by_month(dataset, month, month)
+    if isinstance(dataset, Table):
+        return dataset.column('value')[~dataset.nulls['value']].sum().item()
+
     sum_so_far = 0
 
-    for i in range(len(dataset)):
-        if dataset[i][3] != '':
-            sum_so_far = sum_so_far + int(dataset[i][3])
+    for each in dataset:
+        if each[3] is not None and each[3] != '':
+            sum_so_far = sum_so_far + convert_value(each[3], CRIME_SCHEMA[3])
 
     return sum_so_far
 
 
+def groups() -> CrimeGroups:
+    """Return the sums and counts of the crime csv file grouped by police service, month and
+    violation. The groups are built once per process, and again only when the file changes.
+
+    >>> groups().aggregate(['month'], ['Ontario'], [2021, 3], [2021, 5], ['Total assaults'])
+    """
+    return data_cache.load(CRIMES_FILE, load_crime_groups)
+
+
+def sum_all_crimes(month: list[int], province: str) -> int:
+    """
+    ...
+    >>> sum_all_crimes([2020, 5], 'Ontario')
+    """
+    return groups().total([province], month)[0]
+
+
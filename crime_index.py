@@ -0,0 +1,191 @@
+"""Byte-offset index over the crime data
+
+The index maps every (geography, month, violation) of 'Data/crimes_original_data.csv' to the byte
+ranges of its rows in the file, so a query for one province and one month only reads those rows.
+The index is stored next to the csv file with the suffix '.idx', in the snapshot format, and is
+rebuilt whenever the csv file changes. iter_crimes in crime_filtering reads through it when it is
+given filters.
+"""
+
+import bisect
+import csv
+import io
+from typing import Optional
+
+import numpy as np
+
+import data_cache
+import snapshot
+from crime_names import TypeMatcher
+
+
+class CrimeIndex:
+    """The byte ranges of the rows of a crime csv file, sorted by geography, month and violation.
+
+    Each row of the file is given the key (geography code * number of months + month code)
+    * number of violations + violation code, where the codes are positions in the sorted lists
+    of distinct geographies, months and violations.
+
+    Instance Attributes:
+        - filename: the csv file the index was built from
+        - geos: the distinct geographies of the file, sorted
+        - months: the distinct 'YYYY-MM' months of the file, sorted
+        - violations: the distinct violations of the file, sorted
+        - keys: the key of every row, sorted
+        - offsets: the byte offset of every row in the file, in the order of keys
+        - lengths: the length in bytes of every row in the file, in the order of keys
+    """
+    filename: str
+    geos: list[str]
+    months: list[str]
+    violations: list[str]
+    keys: np.ndarray
+    offsets: np.ndarray
+    lengths: np.ndarray
+
+    def __init__(self, filename: str, geos: list[str], months: list[str], violations: list[str],
+                 keys: np.ndarray, offsets: np.ndarray, lengths: np.ndarray) -> None:
+        self.filename = filename
+        self.geos = geos
+        self.months = months
+        self.violations = violations
+        self.keys = keys
+        self.offsets = offsets
+        self.lengths = lengths
+
+    def ranges(self, provinces: Optional[list[str]] = None,
+               start_date: Optional[list[int]] = None, end_date: Optional[list[int]] = None,
+               types: Optional[list[str]] = None) -> list[tuple[int, int]]:
+        """Return the (offset, length) byte ranges of the rows whose geography contains one of
+        provinces, whose month is between start_date and end_date ([year, month]), inclusive, and
+        whose violation contains one of types. A condition that is None selects every row.
+        Adjacent ranges are merged and the ranges are in file order.
+        """
+        first_month = bisect.bisect_left(self.months, '%04d-%02d' % tuple(start_date)) \
+            if start_date is not None else 0
+        stop_month = bisect.bisect_right(self.months, '%04d-%02d' % tuple(end_date)) \
+            if end_date is not None else len(self.months)
+        if first_month >= stop_month:
+            return []
+        matcher = TypeMatcher(types or [])
+        violation_codes = np.array([code for code, violation in enumerate(self.violations)
+                                    if types is None or matcher.matches(violation)],
+                                   dtype=np.int64)
+
+        selected = []
+        for geo_code, geo in enumerate(self.geos):
+            if provinces is not None and not any(other in geo for other in provinces):
+                continue
+            # the keys of a geography and a range of months are contiguous
+            first = (geo_code * len(self.months) + first_month) * len(self.violations)
+            last = (geo_code * len(self.months) + stop_month) * len(self.violations)
+            start, stop = np.searchsorted(self.keys, [first, last])
+            if start == stop:
+                continue
+            rows = np.arange(start, stop)
+            if types is not None:
+                rows = rows[np.isin(self.keys[start:stop] % len(self.violations),
+                                    violation_codes)]
+            selected.append(rows)
+
+        if not selected:
+            return []
+        rows = np.concatenate(selected)
+        order = np.argsort(self.offsets[rows])
+        offsets = self.offsets[rows][order].tolist()
+        lengths = self.lengths[rows][order].tolist()
+
+        merged = []
+        for offset, length in zip(offsets, lengths):
+            if merged and merged[-1][0] + merged[-1][1] == offset:
+                merged[-1] = (merged[-1][0], merged[-1][1] + length)
+            else:
+                merged.append((offset, length))
+        return merged
+
+    def rows(self, provinces: Optional[list[str]] = None,
+             start_date: Optional[list[int]] = None, end_date: Optional[list[int]] = None,
+             types: Optional[list[str]] = None) -> list[list[str]]:
+        """Return the rows selected by ranges, in the same format as read_crimes returns, reading
+        only those rows from the csv file.
+
+        >>> index = load_index('../../Data/crimes_original_data.csv')
+        >>> index.rows(['Ontario'], [2021, 5], [2021, 5], ['Total assaults'])
+        """
+        list_so_far = []
+
+        with open(self.filename, 'rb') as f:
+            for offset, length in self.ranges(provinces, start_date, end_date, types):
+                f.seek(offset)
+                text = f.read(length).decode('UTF8')
+                for row in csv.reader(io.StringIO(text, newline=''), delimiter=','):
+                    list_so_far.append([row[0], row[1], row[3], row[11]])
+
+        return list_so_far
+
+
+def index_path(filename: str) -> str:
+    """Return the path of the index of filename."""
+    return filename + '.idx'
+
+
+def load_index(filename: str) -> CrimeIndex:
+    """Return the index of the crime csv file filename. The index is memory-mapped from its file
+    when it is up to date, and built and saved otherwise. An index file that was cut short is
+    built again, and the index is written through a temporary file of its own, like a snapshot.
+
+    Use data_cache.load(filename, load_index) to share the index within a process.
+    """
+    source = data_cache.fingerprint(filename)
+    path = index_path(filename)
+    stored = snapshot.read_snapshot(path, source)
+    if stored is not None:
+        return CrimeIndex(filename, stored.metadata['geos'], stored.metadata['months'],
+                          stored.metadata['violations'], stored.columns['key'],
+                          stored.columns['offset'], stored.columns['length'])
+
+    index = build_index(filename)
+    try:
+        snapshot.write_snapshot(path, source, ['key', 'offset', 'length'],
+                                {'key': index.keys, 'offset': index.offsets,
+                                 'length': index.lengths}, {},
+                                {'geos': index.geos, 'months': index.months,
+                                 'violations': index.violations})
+    except OSError:
+        pass  # the index only saves time, so a read-only data directory is not an error
+    return index
+
+
+def build_index(filename: str) -> CrimeIndex:
+    """Scan the crime csv file filename once and return its index."""
+    geos = []
+    months = []
+    violations = []
+    offsets = []
+    lengths = []
+
+    with open(filename, 'rb') as f:
+        offset = len(f.readline())  # skip the header
+
+        for line in f:
+            row = next(csv.reader([line.decode('UTF8')], delimiter=','))
+            geos.append(row[1])
+            months.append(row[0][:7])
+            violations.append(row[3])
+            offsets.append(offset)
+            lengths.append(len(line))
+            offset = offset + len(line)
+
+    geo_names, geo_codes = np.unique(np.array(geos, dtype=str), return_inverse=True)
+    month_names, month_codes = np.unique(np.array(months, dtype=str), return_inverse=True)
+    violation_names, violation_codes = np.unique(np.array(violations, dtype=str),
+                                                 return_inverse=True)
+
+    keys = (geo_codes.astype(np.int64) * len(month_names)
+            + month_codes) * len(violation_names) + violation_codes
+    order = np.argsort(keys, kind='stable')
+
+    return CrimeIndex(filename, geo_names.tolist(), month_names.tolist(),
+                      violation_names.tolist(), keys[order],
+                      np.array(offsets, dtype=np.int64)[order],
+                      np.array(lengths, dtype=np.int64)[order])
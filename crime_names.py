@@ -0,0 +1,67 @@
+"""Names of the provinces and crime types of the crime data
+
+The geography of a row of the crime data names its police service, such as
+'Ontario Provincial Police, Ontario [35000]', and its violation names a crime type, such as
+'Total assaults'. Both are matched by substring against the names kept here.
+"""
+
+import re
+
+PROVINCES = ['British Columbia', 'Alberta', 'Saskatchewan', 'Manitoba', 'Ontario', 'Quebec',
+             'Newfoundland and Labrador', 'New Brunswick', 'Nova Scotia', 'Prince Edward Island',
+             'Yukon', 'Northwest Territories', 'Nunavut', 'Canada']
+
+
+def provinces_in(geo: str) -> list[str]:
+    """Return the names in PROVINCES that appear in the geography geo.
+
+    >>> provinces_in('Ontario Provincial Police, Ontario [35000]')
+    ['Ontario']
+    """
+    return [province for province in PROVINCES if province in geo]
+
+
+class TypeMatcher:
+    """A set of crime types compiled once, to find which of them appear in violation names.
+
+    All the types are searched for in a single pass over a name by one regular expression, and
+    the answer for each distinct violation name is remembered, so classifying a row costs one
+    dictionary lookup however many types were requested.
+
+    Instance Attributes:
+        - types: the crime types, each matched as a substring of violation names
+
+    >>> matcher = TypeMatcher(['assault', 'Robbery'])
+    >>> matcher.matches('Total assaults'), matcher.matches('Break and enter')
+    (True, False)
+    >>> sorted(matcher.classify('Robbery with assault'))
+    ['Robbery', 'assault']
+    """
+    types: list[str]
+    _pattern: re.Pattern
+    _matches: dict[str, bool]
+    _classes: dict[str, frozenset[str]]
+
+    def __init__(self, types: list[str]) -> None:
+        self.types = list(types)
+        alternatives = list(dict.fromkeys(self.types))
+        self._pattern = re.compile('|'.join(re.escape(other) for other in alternatives)) \
+            if alternatives else re.compile('(?!)')
+        self._matches = {}
+        self._classes = {}
+
+    def matches(self, violation: str) -> bool:
+        """Return whether violation contains any of the types."""
+        if violation not in self._matches:
+            self._matches[violation] = self._pattern.search(violation) is not None
+        return self._matches[violation]
+
+    def classify(self, violation: str) -> frozenset[str]:
+        """Return the types that violation contains."""
+        if violation not in self._classes:
+            if self.matches(violation):
+                self._classes[violation] = frozenset(other for other in self.types
+                                                     if other in violation)
+            else:
+                self._classes[violation] = frozenset()
+        return self._classes[violation]
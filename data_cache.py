@@ -0,0 +1,140 @@
+"""Process-wide cache of parsed data files"""
+
+import hashlib
+import os
+from typing import Any, Callable, Optional
+
+# An update takes a file, the value loaded from it before and the number of bytes of the file
+# that value was parsed from, and returns the value for the file as it is now, or None if it
+# cannot be derived from the old one.
+Update = Callable[[str, Any, int], Optional[Any]]
+
+# The number of bytes prefix_checksum reads at a time.
+CHECKSUM_BLOCK = 1 << 20
+
+
+def fingerprint(filename: str) -> tuple[int, int]:
+    """Return the size and modification time of filename. The fingerprint changes whenever the
+    file is rewritten or appended to."""
+    stat = os.stat(filename)
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def prefix_checksum(filename: str, size: int) -> Optional[str]:
+    """Return a checksum of the first size bytes of filename, or None if the file is shorter.
+
+    A file that was only appended to keeps the checksum of its old size, so comparing checksums
+    tells an append from any change to the bytes already parsed. The whole prefix is hashed,
+    which only reads the file, at a small fraction of the cost of parsing it.
+    """
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < size:
+            return None
+        left = size
+        while left > 0:
+            block = f.read(min(left, CHECKSUM_BLOCK))
+            if not block:
+                return None
+            digest.update(block)
+            left = left - len(block)
+    return digest.hexdigest()
+
+
+class DatasetCache:
+    """A cache of parsed data files, keyed by the path of the file and the loader that parsed it.
+
+    A file is parsed again only when its size or modification time changed since it was last
+    loaded. The parsed values are shared between callers, so they must not be modified.
+
+    When a value is loaded with an update, the number of bytes it was parsed from is kept with
+    it, along with the prefix_checksum of those bytes, and the update is only used if the file
+    still starts with them. That number is the offset attribute of the value if it has one, such
+    as a Table, because rows appended while the file was being parsed may have been parsed too.
+    Otherwise it is the size of the file when the load started.
+
+    Instance Attributes:
+        - hits: the number of loads answered from the cache
+        - misses: the number of loads that had to parse the file
+        - updates: the number of loads that only parsed what was appended to the file
+    """
+    hits: int
+    misses: int
+    updates: int
+    _entries: dict[tuple[str, Callable], tuple[tuple[int, int], Any, int, Optional[str]]]
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.updates = 0
+        self._entries = {}
+
+    def load(self, filename: str, loader: Callable[[str], Any],
+             update: Optional[Update] = None) -> Any:
+        """Return loader(filename), parsing the file only if it is not cached or has changed.
+
+        If the file has changed and update is given, the cached value is passed to update first,
+        so a file that was only appended to costs as much as the new rows. The update is skipped
+        if the bytes the cached value was loaded from are not the start of the file anymore.
+        """
+        key = (os.path.abspath(filename), loader)
+        current = fingerprint(filename)
+        entry = self._entries.get(key)
+
+        if entry is not None and entry[0] == current:
+            self.hits = self.hits + 1
+            return entry[1]
+
+        if entry is not None and update is not None and entry[3] is not None \
+                and prefix_checksum(filename, entry[2]) == entry[3]:
+            value = update(filename, entry[1], entry[2])
+            if value is not None:
+                self.updates = self.updates + 1
+                self._store(key, filename, current, value, update)
+                return value
+
+        self.misses = self.misses + 1
+        value = loader(filename)
+        self._store(key, filename, current, value, update)
+        return value
+
+    def _store(self, key: tuple[str, Callable], filename: str, current: tuple[int, int],
+               value: Any, update: Optional[Update]) -> None:
+        """Keep value, loaded from filename when its fingerprint was current, under key."""
+        size = getattr(value, 'offset', None)
+        size = size if size is not None else current[0]
+        checksum = prefix_checksum(filename, size) if update is not None else None
+        self._entries[key] = (current, value, size, checksum)
+
+    def invalidate(self, filename: Optional[str] = None) -> None:
+        """Forget the parsed values of filename, or of every file if filename is None."""
+        if filename is None:
+            self._entries.clear()
+        else:
+            path = os.path.abspath(filename)
+            self._entries = {key: entry for key, entry in self._entries.items()
+                             if key[0] != path}
+
+    def stats(self) -> dict[str, int]:
+        """Return the number of hits, misses, updates and cached files."""
+        return {'hits': self.hits, 'misses': self.misses, 'updates': self.updates,
+                'entries': len(self._entries)}
+
+
+# The cache shared by every module of the project.
+CACHE = DatasetCache()
+
+
+def load(filename: str, loader: Callable[[str], Any], update: Optional[Update] = None) -> Any:
+    """Return loader(filename) through the shared cache, using update for appended files.
+
+    >>> from covid_filtering import load_data
+    >>> dataset = load('../../Data/covid19_original_data.csv', load_data)
+    """
+    return CACHE.load(filename, loader, update)
+
+
+def invalidate(filename: Optional[str] = None) -> None:
+    """Forget the parsed values of filename, or of every file if filename is None, in the shared
+    cache."""
+    CACHE.invalidate(filename)
@@ -1,10 +1,12 @@
 """linear regression models between covid cases and crime reports"""
 
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
+from scipy import stats
 from statsmodels.formula.api import ols
-from covid_filtering import total_by_month
-from crime_filtering import crimes_by_type, read_crimes, filter_by_month
+from covid_filtering import total_by_months
+from crime_filtering import TypeMatcher, groups
 
 # In the linear regression model, we want to see the relationship between the number of covid cases
 # and the number of crime rates per crime type and see if we can predict the
@@ -30,12 +32,12 @@ def new_covid_data(date: list[list[int]]) -> pd.DataFrame:
     This function returns a new data frame consisting of the number of total covid cases, active cases,
     and non-active cases per month in Canada.
 
+    All the months are read at once by total_by_months.
+
     >>> date = all_dates_list()
     >>> new_covid_data(date)
     """
-    lst = []
-    for each in date:
-        lst = lst + [total_by_month(each, 'Canada', ['numtotal', 'numtoday', 'numactive'])]
+    lst = total_by_months(date, ['Canada'], ['numtotal', 'numtoday', 'numactive'])
     return pd.DataFrame(lst)
 
 
@@ -44,26 +46,42 @@ def new_crime_data(crimetype: str) -> pd.DataFrame:
     This function returns a new data frame that includes the total number of crime reports of a
     particular crime between 2020.4 and 2021.5.
 
+    All the months are summed at once from the crime groups.
+
     >>> new_crime_data('Total assault')
     """
-    dataset = read_crimes('../../Data/crimes_original_data.csv')
-    crimes_so_far = crimes_by_type(dataset, [crimetype])
     date = all_dates_list()
+    totals = {tuple(row[0]): row[1]
+              for row in groups().aggregate(['month'], None, date[0], date[-1], [crimetype])}
 
-    lst_so_far = []
-    count = 0
-
-    for each in date:
-        result = filter_by_month(crimes_so_far, each, each)
-        for i in range(len(result)):
-            if result[i][3] != '':
-                count = count + int(result[i][3])
-        lst_so_far = lst_so_far + [count]
-        count = 0
+    lst_so_far = [totals.get(tuple(each), 0) for each in date]
 
     return pd.DataFrame(lst_so_far)
 
 
+def new_crime_targets(crimetypes: list[str]) -> pd.DataFrame:
+    """
+    This function returns a data frame with one column per crime type of crimetypes, holding the
+    same totals new_crime_data returns for each of them, per month of all_dates_list.
+
+    Every type is summed from one aggregate of the crime groups by violation and month.
+
+    >>> new_crime_targets(['Total assault', 'Robbery'])
+    """
+    date = all_dates_list()
+    positions = {tuple(each): i for i, each in enumerate(date)}
+    matcher = TypeMatcher(crimetypes)
+    crime_groups = groups()
+    totals = np.zeros((len(date), len(crimetypes)), dtype=crime_groups.sums.dtype)
+
+    for violation, month, total, _, _ in crime_groups.aggregate(['violation', 'month'], None,
+                                                             date[0], date[-1], crimetypes):
+        for crimetype in matcher.classify(violation):
+            totals[positions[tuple(month)], crimetypes.index(crimetype)] += total
+
+    return pd.DataFrame(totals, columns=crimetypes)
+
+
 def new_df(dataframe1: pd.DataFrame, dataframe2: pd.DataFrame) -> pd.DataFrame:
     """
     This function creates a final dataframe by merging the two given dataframes.
@@ -113,6 +131,51 @@ def linear_regression(x: pd.Series, y: pd.Series) -> list[float, str]:
     return [b0, b1, reg_line]
 
 
+def batched_ols(design: pd.DataFrame, targets: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    """
+    This function fits y = b0 + b1 x1 + ... + bk xk by least squares for every column y of targets,
+    with the columns of design as x1, ..., xk, and returns the same statistics show prints for
+    each model.
+
+    All the models share design, so they are fitted together by one least-squares solve, and
+    fitting many crime types costs about as much as fitting one. The rows of design and targets
+    must be the same months, without missing values.
+
+    The returned dictionary maps 'coefficients', 'std_errors', 't_values' and 'p_values' to data
+    frames with one row per coefficient ('Intercept' and the columns of design) and one column
+    per target, and 'r_squared' to a data frame with one row.
+
+    The statistics are the ones ols in show reports. With covid[[3]], the column new_df calls
+    'Active', as design, each column of the result matches ols('Crime ~ Active', ...).fit() for
+    that crime type.
+
+    >>> covid = new_covid_data(all_dates_list())
+    >>> crimes = new_crime_targets(['Total assault', 'Robbery'])
+    >>> fit = batched_ols(covid[[3]], crimes)
+    >>> fit['p_values']
+    """
+    x = np.column_stack([np.ones(len(design)), design.to_numpy(dtype=np.float64)])
+    y = targets.to_numpy(dtype=np.float64)
+
+    coefficients, _, rank, _ = np.linalg.lstsq(x, y, rcond=None)
+    residuals = y - x @ coefficients
+    dof = len(x) - rank
+    variance = (residuals ** 2).sum(axis=0) / dof
+    std_errors = np.sqrt(np.outer(np.diag(np.linalg.pinv(x.T @ x)), variance))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_values = coefficients / std_errors
+        r_squared = 1 - (residuals ** 2).sum(axis=0) / ((y - y.mean(axis=0)) ** 2).sum(axis=0)
+    p_values = 2 * stats.t.sf(np.abs(t_values), dof)
+
+    names = ['Intercept'] + list(design.columns)
+    return {'coefficients': pd.DataFrame(coefficients, index=names, columns=targets.columns),
+            'std_errors': pd.DataFrame(std_errors, index=names, columns=targets.columns),
+            't_values': pd.DataFrame(t_values, index=names, columns=targets.columns),
+            'p_values': pd.DataFrame(p_values, index=names, columns=targets.columns),
+            'r_squared': pd.DataFrame([r_squared], index=['R-squared'],
+                                      columns=targets.columns)}
+
+
 def show(final_data: pd.DataFrame) -> None:
     """
     This function aims to check whether the changes in the number of Covid cases are not associated
@@ -157,7 +220,8 @@ if __name__ == '__main__':
 
     python_ta.check_all(config={
         'extra-imports': ['matplotlib.pyplot',
-                          'numpy'],
+                          'numpy',
+                          'scipy'],
         'allowed-io': [],
         'max-line-length': 150,
         'disable': ['R1705', 'C0200']
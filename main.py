@@ -1,13 +1,22 @@
-"""Main python file for project"""
+"""Main python file for project
+
+Call memo.enable() to remember the results of total_by_month, avg_by_month, avg_of_province and
+sum_all_crimes, so that repeated calls answer at once until the data files change.
+"""
 import runpy
 
+import correlation
 import covid_filtering
-from crime_filtering import read_crimes, crimes_by_province, filter_by_month, crimes_by_type
-import math
+import crime_filtering
+import memo
+from columnar import month_range
+from covid_filtering import COVID_FILE
+from crime_filtering import CRIMES_FILE
 
 ####################################################################################################
 
 
+@memo.memoize(COVID_FILE)
 def total_by_month(month: list[int], province: str, categories: list[str]) \
         -> list[str, int]:
     """Return the sum of 'numtoday', 'numactive' or other 'num_' categories of the
@@ -18,23 +27,10 @@ def total_by_month(month: list[int], province: str, categories: list[str]) \
 
     >>> total_by_month([2021, 5], 'Ontario', ['numtoday', 'numactive'])
     """
-    categories = ['prname', 'date'] + categories
-    dataset = covid_filtering.filter_by_date(month, month)
-    dataset = covid_filtering.filter_by_province([province], dataset)
-    dataset = covid_filtering.dataset_by_type(dataset)
-    dataset = covid_filtering.filter_columns(categories, dataset)
-    sum_so_far = 0
-    list_so_far = [province, month]
-
-    for j in range(2, len(dataset[1])):
-        for i in range(len(dataset)):
-            sum_so_far = sum_so_far + int(dataset[i][j])
-        list_so_far = list_so_far + [sum_so_far]
-        sum_so_far = 0
-
-    return list_so_far
+    return covid_filtering.total_by_month(month, province, categories)
 
 
+@memo.memoize(COVID_FILE)
 def avg_by_month(month: list[int], province: str, category: [str]) -> int:
     """Return the average of each category's by dividing total value by number of dates in
     corresponding month.
@@ -46,16 +42,16 @@ def avg_by_month(month: list[int], province: str, category: [str]) -> int:
     >>> avg_by_month([2021, 5], 'Ontario', ['numtoday'])
     2197
     """
-    total_value = total_by_month(month, province, category)
-    dataset = covid_filtering.filter_by_date(month, month)
-    dataset = covid_filtering.filter_by_province([province], dataset)
-    all_avg = round(int(total_value[2]) / len(dataset))
+    totals = covid_filtering.cube()
+    total_value = totals.total(province, month, category[0])
+    all_avg = round(int(total_value) / totals.day_count(province, month))
 
     return all_avg
 
 ####################################################################################################
 
 
+@memo.memoize(CRIMES_FILE)
 def avg_of_province(month: list[int], province: str, category: [str]) -> int:
     """Return the average of category's value by dividing total value by number of provincial police
      incorresponding month.
@@ -64,39 +60,24 @@ def avg_of_province(month: list[int], province: str, category: [str]) -> int:
 
     You must only put one category per time.
 
+    The sum and the number of values are read from the crime groups of crime_filtering.
+
     >>> avg_of_province([2021, 5], 'Ontario', ['Total assaults'])
     487
     """
-    dataset = read_crimes('../../Data/crimes_original_data.csv')
-    dataset = crimes_by_province(dataset, [province])
-    dataset = crimes_by_type(dataset, category)
-    dataset = filter_by_month(dataset, month, month)
-    list_so_far = []
-
-    for i in range(len(dataset)):
-        if dataset[i][3] != '':
-            list_so_far = list_so_far + [int(dataset[i][3])]
-
-    all_avg = round(sum(list_so_far) / len(list_so_far))
+    total, count = crime_filtering.groups().total([province], month, category)
+    all_avg = round(total / count)
 
     return all_avg
 
 
+@memo.memoize(CRIMES_FILE)
 def sum_all_crimes(month: list[int], province: str) -> int:
     """
     ...
     >>> sum_all_crimes([2020, 5], 'Ontario')
     """
-    dataset = read_crimes('../../Data/crimes_original_data.csv')
-    dataset = crimes_by_province(dataset, [province])
-    dataset = filter_by_month(dataset, month, month)
-    sum_so_far = 0
-
-    for i in range(len(dataset)):
-        if dataset[i][3] != '':
-            sum_so_far = sum_so_far + int(dataset[i][3])
-
-    return sum_so_far
+    return crime_filtering.sum_all_crimes(month, province)
 
 
 ####################################################################################################
@@ -106,35 +87,16 @@ def covid_data_for_r(start_month: list[int], end_month: list[int], province: str
     """
     This function is made to be used for calculating correlation coefficient value, r.
 
+    The months can span any number of years. Every month is read from the cube of covid_filtering
+    at once, and a month without data gives None.
+
     >>> covid_data_for_r([2021, 3], [2021, 5], 'Ontario', 'numactive')
     [13462, 35007, 26183]
     """
-    covid_so_far = []
-    i = start_month[1]
-
-    if start_month[0] == 2020 and end_month[0] == 2020:
-        while i <= end_month[1]:
-            covid_so_far = covid_so_far + [[[2020, i],
-                                            avg_by_month([2020, i], province, [covid_category])]]
-            i = i + 1
-    elif start_month[0] == 2021 and end_month[0] == 2021:
-        while i <= end_month[1]:
-            covid_so_far = covid_so_far + [[[2021, i],
-                                            avg_by_month([2021, i], province, [covid_category])]]
-            i = i + 1
-    elif start_month[0] == 2020 and end_month[0] == 2021:
-        while i <= 12 + end_month[1]:
-            if i <= 12:
-                covid_so_far = covid_so_far + [[[2020, i],
-                                                avg_by_month([2020, i], province, [covid_category])]]
-            if i > 12:
-                covid_so_far = covid_so_far + [[[2021, i - 12],
-                                                avg_by_month([2021, i - 12], province,
-                                                [covid_category])]]
-            i = i + 1
-
-    covid_so_far = [covid_so_far[x][1] for x in range(len(covid_so_far))]
-    return covid_so_far
+    means = covid_filtering.cube().means(province, covid_category,
+                                         month_range(start_month, end_month))
+
+    return [round(mean) if mean is not None else None for mean in means]
 
 
 def crime_data_for_r(start_month: list[int], end_month: list[int], province: str,
@@ -142,39 +104,16 @@ def crime_data_for_r(start_month: list[int], end_month: list[int], province: str
     """
     This function is made to be used for calculating correlation coefficient value, r.
 
-    This function takes about 30 seconds to run. Please be patient.
+    The months can span any number of years. Every month is read from the crime groups of
+    crime_filtering at once, and a month without values gives None.
 
     >>> crime_data_for_r([2021, 3], [2021, 5], 'Ontario', 'Total assaults')
     [450, 412, 487]
     """
-    crime_so_far = []
-    j = start_month[1]
-
-    if start_month[0] == 2020 and end_month[0] == 2020:
-        while j <= end_month[1]:
-            crime_so_far = crime_so_far + [[[2020, j],
-                                            avg_of_province([2020, j], province, [crime_category])]]
-            j = j + 1
-    elif start_month[0] == 2021 and end_month[0] == 2021:
-        while j <= end_month[1]:
-            crime_so_far = crime_so_far + [[[2021, j],
-                                            avg_of_province([2021, j], province,
-                                                            [crime_category])]]
-            j = j + 1
-    elif start_month[0] == 2020 and end_month[0] == 2021:
-        while j <= 12 + end_month[1]:
-            if j <= 12:
-                crime_so_far = crime_so_far + [[[2020, j],
-                                                avg_of_province([2020, j], province,
-                                                                [crime_category])]]
-            if j > 12:
-                crime_so_far = crime_so_far + [[[2021, j - 12],
-                                                avg_of_province([2021, j - 12], province,
-                                                [crime_category])]]
-            j = j + 1
-
-    crime_so_far = [crime_so_far[x][1] for x in range(len(crime_so_far))]
-    return crime_so_far
+    means = crime_filtering.groups().means([province], month_range(start_month, end_month),
+                                           [crime_category])
+
+    return [round(mean) if mean is not None else None for mean in means]
 
 
 def correlation_coefficient(covid_dataset: list[int], crime_dataset: list[int]) -> float:
@@ -182,6 +121,9 @@ def correlation_coefficient(covid_dataset: list[int], crime_dataset: list[int])
     the given province and given period. The covid-19 dataset and crime case dataset should be
     average by month value.
 
+    The coefficient is computed by correlation.correlation_matrix, which also correlates many
+    series at once. It is nan when either dataset is constant or has a month without data.
+
     ***
     covid_data_for_r must be used to get the covid_dataset.
     crime_data_for_r must be used to get the crime_dataset.
@@ -195,17 +137,9 @@ def correlation_coefficient(covid_dataset: list[int], crime_dataset: list[int])
     >>> correlation_coefficient(covid_dataset, crime_dataset)
     -0.382
     """
-    covid_mean = sum(covid_dataset) / len(covid_dataset)
-    crime_mean = sum(crime_dataset) / len(crime_dataset)
-
-    r_value = sum([(covid_dataset[x] - covid_mean) * (crime_dataset[x] - crime_mean)
-                   for x in range(len(covid_dataset))]) / \
-                math.sqrt(sum([(covid_dataset[x] - covid_mean) ** 2
-                               for x in range(len(covid_dataset))]) *
-                          sum([(crime_dataset[x] - crime_mean) ** 2
-                               for x in range(len(crime_dataset))]))
+    r_value = correlation.correlation_matrix([covid_dataset], [crime_dataset])[0, 0]
 
-    return round(r_value, 3)
+    return round(float(r_value), 3)
 
 
 def show_linear_regression() -> None:
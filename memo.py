@@ -0,0 +1,133 @@
+"""Opt-in memoization of the functions that summarize a data file
+
+A memoized function remembers its results by its arguments and the fingerprint of the data file
+it reads, so calling it again with the same arguments answers from memory until the file
+changes. Memoization is off until enable is called. Only the maxsize most recently used results
+are kept.
+
+>>> import memo
+>>> memo.enable(maxsize=256)
+>>> memo.stats()
+{'hits': 0, 'misses': 0, 'evictions': 0, 'entries': 0, 'maxsize': 256}
+"""
+
+import copy
+import functools
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+import data_cache
+
+
+class Memo:
+    """A bounded store of function results, evicting the least recently used result first.
+
+    Instance Attributes:
+        - enabled: whether memoized functions use this store
+        - maxsize: the largest number of results kept
+        - hits: the number of calls answered from the store
+        - misses: the number of calls that had to run their function
+        - evictions: the number of results dropped to stay within maxsize
+    """
+    enabled: bool
+    maxsize: int
+    hits: int
+    misses: int
+    evictions: int
+    _entries: OrderedDict[Hashable, Any]
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        self.enabled = False
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def call(self, key: Hashable, function: Callable[[], Any]) -> Any:
+        """Return the result remembered for key, or remember and return function()."""
+        if key in self._entries:
+            self.hits = self.hits + 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+        self.misses = self.misses + 1
+        value = function()
+        self._entries[key] = value
+        self._shrink()
+        return value
+
+    def resize(self, maxsize: int) -> None:
+        """Keep at most maxsize results from now on, evicting the oldest ones now if needed."""
+        self.maxsize = maxsize
+        self._shrink()
+
+    def clear(self) -> None:
+        """Forget every result and reset the statistics."""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self) -> dict[str, int]:
+        """Return the number of hits, misses, evictions and stored results, and the size bound."""
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': len(self._entries), 'maxsize': self.maxsize}
+
+    def _shrink(self) -> None:
+        """Evict the least recently used results until at most maxsize are left."""
+        while len(self._entries) > max(self.maxsize, 0):
+            self._entries.popitem(last=False)
+            self.evictions = self.evictions + 1
+
+
+# The store shared by every memoized function of the project.
+MEMO = Memo()
+
+
+def memoize(filename: str) -> Callable[[Callable], Callable]:
+    """Return a decorator memoizing a function that reads the data file filename.
+
+    The key of a call is the function, its arguments, with lists turned into tuples, and the
+    fingerprint of filename. A copy of the result is returned, so callers may modify it.
+
+    >>> @memoize('../../Data/covid19_original_data.csv')
+    ... def rows(month: list[int]) -> int:
+    ...     return month[0] * 12 + month[1]
+    """
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def memoized(*args: Any, **kwargs: Any) -> Any:
+            if not MEMO.enabled:
+                return function(*args, **kwargs)
+            key = (function, _frozen(args), _frozen(sorted(kwargs.items())),
+                   data_cache.fingerprint(filename))
+            return copy.deepcopy(MEMO.call(key, lambda: function(*args, **kwargs)))
+
+        return memoized
+
+    return decorator
+
+
+def enable(maxsize: int = 1024) -> None:
+    """Turn memoization on, keeping at most maxsize results."""
+    MEMO.enabled = True
+    MEMO.resize(maxsize)
+
+
+def disable() -> None:
+    """Turn memoization off and forget every result."""
+    MEMO.enabled = False
+    MEMO.clear()
+
+
+def stats() -> dict[str, int]:
+    """Return the statistics of the shared store."""
+    return MEMO.stats()
+
+
+def _frozen(value: Any) -> Hashable:
+    """Return value with every list and tuple in it turned into a tuple, recursively."""
+    if isinstance(value, (list, tuple)):
+        return tuple(_frozen(each) for each in value)
+    return value
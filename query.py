@@ -0,0 +1,93 @@
+"""Lazy queries over the covid-19 dataset
+
+A query records the months, provinces and columns it asks for, and only touches the data when a
+result is requested. The month range is found by binary search on the MonthIndex of the table,
+the provinces are then checked on the codes of those rows only, and the requested columns are
+read for the rows that are left. No filtered table is built in between.
+
+>>> from covid_filtering import query
+>>> query().months([2021, 5], [2021, 5]).provinces(['Ontario']).columns(['numtoday']).sum()
+"""
+
+from typing import Optional, Union
+
+import numpy as np
+
+from columnar import Table
+
+
+class CovidQuery:
+    """A query over a Table of the covid-19 dataset. Every method that adds a condition returns a
+    new query, so a query can be reused as the start of several others.
+
+    Instance Attributes:
+        - table: the table the query runs on
+    """
+    table: Table
+    _months: Optional[tuple[list[int], list[int]]]
+    _provinces: Optional[list[str]]
+    _columns: Optional[list[str]]
+
+    def __init__(self, table: Table, months: Optional[tuple[list[int], list[int]]] = None,
+                 provinces: Optional[list[str]] = None,
+                 columns: Optional[list[str]] = None) -> None:
+        self.table = table
+        self._months = months
+        self._provinces = provinces
+        self._columns = columns
+
+    def months(self, start_date: list[int], end_date: list[int]) -> 'CovidQuery':
+        """Return this query restricted to the months from start_date to end_date, inclusive,
+        both in the format [year, month]."""
+        return CovidQuery(self.table, (start_date, end_date), self._provinces, self._columns)
+
+    def provinces(self, provinces: list[str]) -> 'CovidQuery':
+        """Return this query restricted to the rows of the given provinces."""
+        return CovidQuery(self.table, self._months, list(provinces), self._columns)
+
+    def columns(self, columns: list[str]) -> 'CovidQuery':
+        """Return this query returning only the given columns, in the given order. Names that are
+        not columns of the table are ignored, like filter_columns does."""
+        return CovidQuery(self.table, self._months, self._provinces,
+                          [name for name in columns if name in self.table.names])
+
+    def row_ids(self) -> Union[np.ndarray, slice]:
+        """Return the rows of the table selected by the query, in the order of the table, as a
+        slice when they are a contiguous range."""
+        if self._months is not None:
+            rows = self.table.month_index().rows(*self._months)
+        else:
+            rows = np.arange(len(self.table))
+
+        if self._provinces is not None:
+            # check each province name once, then only the codes of the rows already selected
+            wanted = np.array([name in self._provinces
+                               for name in self.table.vocabularies['prname']], dtype=bool)
+            return rows[wanted[self.table.columns['prname'][rows]]]
+        elif len(rows) > 0 and rows[-1] - rows[0] == len(rows) - 1:
+            return slice(int(rows[0]), int(rows[-1]) + 1)
+        return rows
+
+    def count(self) -> int:
+        """Return the number of rows selected by the query."""
+        rows = self.row_ids()
+        if isinstance(rows, slice):
+            return rows.stop - rows.start
+        return len(rows)
+
+    def sum(self) -> list[Union[int, float]]:
+        """Return the sum of each numeric column of the query over the selected rows. Blank cells
+        count as 0. String columns, whose arrays only hold codes, are left out."""
+        rows = self.row_ids()
+        return [self.table.columns[name][rows].sum().item() for name in self._selected()
+                if name in self.table.nulls]
+
+    def rows(self) -> list[list]:
+        """Return the selected rows and columns as a list of rows, the same shape
+        filter_columns returns."""
+        return self.table.take(self.row_ids()).select(self._selected()).to_rows()
+
+    def _selected(self) -> list[str]:
+        """Return the columns of the query, which are all the columns of the table if none were
+        chosen."""
+        return self._columns if self._columns is not None else self.table.names
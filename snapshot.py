@@ -0,0 +1,189 @@
+"""Binary snapshots of parsed data files
+
+A snapshot holds the typed columns of a parsed csv file, so the file does not have to be parsed
+again the next time it is loaded. The snapshot is stored next to the csv file, with the suffix
+'.snap', and has the following layout:
+
+    - the 8 bytes MAGIC
+    - the length of the header, as a little-endian unsigned 64-bit integer
+    - the header, a JSON object describing where the blocks of every column are, the fingerprint
+      of the csv file and any metadata given by the writer
+    - the blocks of every column, each starting at a multiple of 8 bytes
+
+Numeric columns are stored as raw int64 or float64 values. String columns are stored as int32
+codes into their list of distinct strings, which is stored as two more blocks: the int64 offsets
+of the strings and their UTF-8 bytes. Null masks are stored as one byte per row. The header only
+holds offsets and names, so it stays small however many distinct strings there are. Reading a
+snapshot maps the file into memory, so neither the numeric columns nor the codes are copied.
+"""
+
+import json
+import mmap
+import os
+import struct
+import tempfile
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+MAGIC = b'CSCSNAP2'
+
+_HEADER_LENGTH = struct.Struct('<Q')
+
+
+class Snapshot(NamedTuple):
+    """The contents of a snapshot file."""
+    names: list[str]
+    columns: dict[str, np.ndarray]
+    nulls: dict[str, np.ndarray]
+    metadata: dict
+    vocabularies: dict[str, list[str]]
+    source: Optional[tuple[int, int]] = None
+
+
+def snapshot_path(filename: str) -> str:
+    """Return the path of the snapshot of filename."""
+    return filename + '.snap'
+
+
+def write_snapshot(path: str, source: tuple[int, int], names: list[str],
+                   columns: dict[str, np.ndarray], nulls: dict[str, np.ndarray],
+                   metadata: Optional[dict] = None,
+                   vocabularies: Optional[dict[str, list[str]]] = None) -> None:
+    """Write the given columns to a snapshot at path. source is the fingerprint of the csv file
+    the columns were parsed from. metadata must be serializable as JSON.
+
+    A column with an entry in vocabularies already holds int32 codes into that list of strings.
+    Any other column of strings is encoded when it is written.
+
+    The snapshot is written to a temporary file of its own first, so a reader never sees a
+    partial file, and writers running at the same time do not write to the same file.
+    """
+    blocks = []
+    described = []
+    offset = 0
+
+    def add(block: bytes) -> int:
+        """Add block after the previous ones and return the offset it starts at."""
+        nonlocal offset
+        blocks.append(block)
+        start, offset = offset, _aligned(offset + len(block))
+        return start
+
+    for name in names:
+        values = columns[name]
+        description = {'name': name}
+        vocabulary = None
+        if vocabularies is not None and name in vocabularies:
+            vocabulary = vocabularies[name]
+            values = values.astype(np.int32)
+        elif values.dtype == object:
+            vocabulary, codes = np.unique(values.astype(str), return_inverse=True)
+            vocabulary = vocabulary.tolist()
+            values = codes.astype(np.int32)
+        description['dtype'] = values.dtype.str
+        description['offset'] = add(np.ascontiguousarray(values).tobytes())
+
+        if name in nulls:
+            description['nulls'] = add(nulls[name].astype(np.uint8).tobytes())
+        if vocabulary is not None:
+            encoded = [value.encode() for value in vocabulary]
+            ends = np.cumsum([len(value) for value in encoded], dtype=np.int64)
+            description['vocabulary'] = {
+                'count': len(encoded),
+                'offsets': add(np.concatenate([np.zeros(1, np.int64), ends]).tobytes()),
+                'strings': add(b''.join(encoded)),
+                'size': int(ends[-1]) if len(ends) > 0 else 0}
+        described.append(description)
+
+    rows = len(columns[names[0]]) if names else 0
+    header = json.dumps({'source': list(source), 'rows': rows, 'columns': described,
+                         'metadata': metadata or {}}).encode()
+    start = _aligned(len(MAGIC) + _HEADER_LENGTH.size + len(header))
+
+    descriptor, temporary = tempfile.mkstemp(suffix='.tmp', prefix=os.path.basename(path) + '.',
+                                             dir=os.path.dirname(path) or '.')
+    try:
+        os.chmod(temporary, 0o644)  # mkstemp only lets the owner read the file
+        with os.fdopen(descriptor, 'wb') as f:
+            f.write(MAGIC + _HEADER_LENGTH.pack(len(header)) + header)
+            f.write(bytes(start - f.tell()))
+            for block in blocks:
+                f.write(block)
+                f.write(bytes(_aligned(len(block)) - len(block)))
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+def read_snapshot(path: str, source: Optional[tuple[int, int]]) -> Optional[Snapshot]:
+    """Return the column names, columns, null masks and metadata stored in the snapshot at path.
+
+    Return None if there is no snapshot at path, if it is shorter than its header says, or if it
+    was made from a csv file whose fingerprint is different from source. If source is None, the
+    snapshot is returned whatever file it was made from, and its fingerprint tells which version
+    of the file that was.
+    """
+    try:
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return None
+            header_length = _HEADER_LENGTH.unpack(f.read(_HEADER_LENGTH.size))[0]
+            header = json.loads(f.read(header_length))
+            if source is not None and header['source'] != list(source):
+                return None
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError, struct.error):
+        return None
+
+    start = _aligned(len(MAGIC) + _HEADER_LENGTH.size + header_length)
+    names = []
+    columns = {}
+    nulls = {}
+    vocabularies = {}
+
+    try:
+        rows = header['rows']
+        for description in header['columns']:
+            name = description['name']
+            names.append(name)
+            columns[name] = _block(buffer, np.dtype(description['dtype']), rows,
+                                   start + description['offset'])
+            if 'nulls' in description:
+                nulls[name] = _block(buffer, np.dtype(np.uint8), rows,
+                                     start + description['nulls']).view(bool)
+            if 'vocabulary' in description:
+                vocabularies[name] = _strings(buffer, start, description['vocabulary'])
+    except (KeyError, TypeError, ValueError):
+        return None  # a file cut short or a damaged header, treated like a stale snapshot
+
+    return Snapshot(names, columns, nulls, header.get('metadata', {}), vocabularies,
+                    tuple(header['source']))
+
+
+def _block(buffer: mmap.mmap, dtype: np.dtype, count: int, offset: int) -> np.ndarray:
+    """Return the count values of dtype at offset in buffer, without copying them. Raise
+    ValueError if buffer ends before them."""
+    if offset < 0 or offset + count * dtype.itemsize > len(buffer):
+        raise ValueError('the snapshot is shorter than its header says')
+    return np.frombuffer(buffer, dtype=dtype, count=count, offset=offset)
+
+
+def _strings(buffer: mmap.mmap, start: int, description: dict) -> list[str]:
+    """Return the list of strings described by description, whose blocks are at their offsets
+    from start in buffer."""
+    count = description['count']
+    offsets = _block(buffer, np.dtype(np.int64), count + 1,
+                     start + description['offsets']).tolist()
+    data = bytes(_block(buffer, np.dtype(np.uint8), description['size'],
+                        start + description['strings']))
+    text = data.decode()
+    if len(text) == len(data):  # only ASCII characters, so byte offsets are character offsets
+        return [text[first:last] for first, last in zip(offsets, offsets[1:])]
+    return [data[first:last].decode() for first, last in zip(offsets, offsets[1:])]
+
+
+def _aligned(offset: int) -> int:
+    """Return the smallest multiple of 8 that is at least offset."""
+    return (offset + 7) // 8 * 8
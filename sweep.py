@@ -0,0 +1,136 @@
+"""Correlation of every province, covid-19 category, crime type and month window
+
+The series of the whole sweep are built once from the aggregates of both datasets, and are handed
+to every worker process when it starts: a forked worker shares them with the parent, and a
+spawned worker receives one copy, instead of one per task. Each task correlates a batch of month
+windows with correlation_matrix, and the coefficients are written to a csv file ranked by their
+absolute value.
+
+>>> stats = run_sweep('sweep.csv', [2020, 4], [2021, 8], 6, provinces=['Ontario', 'Quebec'])
+"""
+
+import csv
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Optional
+
+import numpy as np
+
+import correlation
+import covid_filtering
+import crime_filtering
+from columnar import month_range
+
+# The header row of the output file.
+HEADER = ['rank', 'province', 'covid_category', 'crime_type', 'start_month', 'end_month', 'r']
+
+# The number of ranked rows written to the output file at a time.
+BLOCK_SIZE = 100000
+
+# The series of the sweep in a worker process, set by _share when the worker starts.
+_SHARED = {}
+
+
+def run_sweep(output: str, start_month: list[int], end_month: list[int],
+              window: Optional[int] = None, provinces: Optional[list[str]] = None,
+              categories: Optional[list[str]] = None, types: Optional[list[str]] = None,
+              workers: Optional[int] = None, verbose: bool = True) -> dict[str, float]:
+    """Write to output the correlation coefficient of every covid-19 category and crime type in
+    every province, over every window of window consecutive months between start_month and
+    end_month, ranked from the strongest to the weakest. Pairs whose coefficient is nan are left
+    out. window defaults to the whole range.
+
+    provinces defaults to PROVINCES of crime_filtering, categories to every numeric column of the
+    covid-19 data, and types to every violation of the crime data. workers defaults to the number
+    of CPU cores. If verbose, the progress and the throughput are printed while the sweep runs.
+
+    Return the number of coefficients computed and written, the number of seconds the sweep took
+    and the number of coefficients computed per second.
+    """
+    started = time.perf_counter()
+    provinces = provinces if provinces is not None else crime_filtering.PROVINCES
+    categories = categories if categories is not None else covid_filtering.cube().columns
+    types = types if types is not None else crime_filtering.groups().violations
+    months = month_range(start_month, end_month)
+    window = window or len(months)
+    windows = [(start, start + window) for start in range(len(months) - window + 1)]
+
+    x = correlation.covid_series(provinces, categories, start_month, end_month)
+    y = correlation.crime_series(provinces, types, start_month, end_month)
+    if verbose:
+        print('series built in %.2f s: %d windows of %d pairs'
+              % (time.perf_counter() - started, len(windows),
+                 len(provinces) * len(categories) * len(types)))
+
+    r_values = np.full((len(windows), len(provinces), len(categories), len(types)), np.nan,
+                       dtype=np.float32)
+    workers = max(min(workers or os.cpu_count() or 1, len(windows)), 1)
+    batches = [list(range(len(windows)))[i::workers * 4] for i in range(workers * 4)]
+    batches = [batch for batch in batches if batch]
+    done = 0
+
+    context = multiprocessing.get_context(
+        'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_share,
+                             initargs=(x, y, windows)) as executor:
+        futures = [executor.submit(_correlate_windows, batch) for batch in batches]
+        for future in as_completed(futures):
+            batch, values = future.result()
+            r_values[batch] = values
+            done = done + len(batch)
+            if verbose:
+                elapsed = time.perf_counter() - started
+                computed = done * r_values[0].size
+                print('%d/%d windows, %d pairs, %.0f pairs/s'
+                      % (done, len(windows), computed, computed / elapsed))
+
+    written = _write_ranked(output, r_values, provinces, categories, types, months, windows)
+    elapsed = time.perf_counter() - started
+    if verbose:
+        print('%d coefficients written to %s in %.2f s' % (written, output, elapsed))
+
+    return {'pairs': r_values.size, 'written': written, 'seconds': elapsed,
+            'pairs_per_second': r_values.size / elapsed if elapsed > 0 else 0.0}
+
+
+def _share(x: np.ndarray, y: np.ndarray, windows: list[tuple[int, int]]) -> None:
+    """Keep the series and windows of the sweep in the worker process."""
+    _SHARED['x'] = x
+    _SHARED['y'] = y
+    _SHARED['windows'] = windows
+
+
+def _correlate_windows(batch: list[int]) -> tuple[list[int], np.ndarray]:
+    """Return batch and the coefficients of every pair of series over each window in batch."""
+    x = _SHARED['x']
+    y = _SHARED['y']
+    values = [correlation.correlation_matrix(x[..., start:stop], y[..., start:stop])
+              for start, stop in (_SHARED['windows'][i] for i in batch)]
+    return batch, np.array(values, dtype=np.float32)
+
+
+def _write_ranked(output: str, r_values: np.ndarray, provinces: list[str],
+                  categories: list[str], types: list[str], months: list[list[int]],
+                  windows: list[tuple[int, int]]) -> int:
+    """Write the coefficients of r_values that are not nan to output, from the largest absolute
+    value to the smallest, BLOCK_SIZE rows at a time. Return the number of rows written."""
+    flat = r_values.reshape(-1)
+    kept = np.flatnonzero(~np.isnan(flat))
+    order = kept[np.argsort(-np.abs(flat[kept]), kind='stable')]
+
+    with open(output, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        for first in range(0, len(order), BLOCK_SIZE):
+            block = order[first:first + BLOCK_SIZE]
+            positions = np.unravel_index(block, r_values.shape)
+            writer.writerows(
+                [first + k + 1, provinces[p], categories[c], types[v],
+                 '%04d-%02d' % tuple(months[windows[w][0]]),
+                 '%04d-%02d' % tuple(months[windows[w][1] - 1]), round(float(r), 4)]
+                for k, (w, p, c, v, r) in enumerate(zip(*(index.tolist() for index in positions),
+                                                        flat[block].tolist())))
+
+    return len(order)